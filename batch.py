@@ -0,0 +1,220 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Модули конвейера из папки scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+import pipeline
+from classes.job import RESULT_SUFFIXES
+from lilypond_service import LilyPondService
+from job_queue import prewarmed_context
+from classes.notes import load_notes
+from notes_to_midi import merge_to_midi
+
+# Расширения аудиофайлов, которые ищутся в папке
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.flac', '.m4a', '.opus')
+
+
+def find_inputs(source):
+    """
+    Поиск аудиофайлов по папке (рекурсивно) или по шаблону glob.
+
+    :param source: Папка или шаблон (например, "records/**/*.mp3").
+    :return: Кортеж (базовая папка, отсортированный список файлов).
+    """
+    if os.path.isdir(source):
+        files = [
+            os.path.join(folder, name)
+            for folder, _, names in os.walk(source)
+            for name in names
+            if name.lower().endswith(AUDIO_EXTENSIONS)
+        ]
+        return os.path.abspath(source), sorted(os.path.abspath(f) for f in files)
+
+    files = sorted(os.path.abspath(f) for f in glob.glob(source, recursive=True) if os.path.isfile(f))
+    base = os.path.commonpath([os.path.dirname(f) for f in files]) if files else os.getcwd()
+    return base, files
+
+
+def output_names(relatives):
+    """
+    Основы имён результатов: имя файла без расширения, а если в одной папке есть
+    файлы с одинаковым именем и разными расширениями (take.mp3 и take.wav) —
+    имя вместе с расширением, чтобы их результаты не перезаписывали друг друга.
+
+    :param relatives: Пути файлов относительно базовой папки.
+    :return: Словарь {относительный путь: основа имён}.
+    """
+    groups = {}
+    for relative in relatives:
+        folder, name = os.path.split(relative)
+        groups.setdefault((folder, os.path.splitext(name)[0].lower()), []).append(relative)
+
+    names = {}
+    for group in groups.values():
+        for relative in group:
+            name = os.path.basename(relative)
+            names[relative] = os.path.splitext(name)[0] if len(group) == 1 else name
+
+    # Проверка до запуска: два файла не должны писать в одни и те же пути
+    clashes = {}
+    for relative, name in names.items():
+        clashes.setdefault((os.path.dirname(relative), name.lower()), []).append(relative)
+    clashes = [group for group in clashes.values() if len(group) > 1]
+    if clashes:
+        raise ValueError(f"Совпадают имена результатов: {clashes}")
+    return names
+
+
+def load_manifest(manifest_path):
+    """
+    Загрузка манифеста предыдущего запуска (для продолжения после прерывания).
+    """
+    if not os.path.exists(manifest_path):
+        return {"files": {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось прочитать манифест {manifest_path}: {e}")
+        return {"files": {}}
+
+
+def save_manifest(manifest, manifest_path):
+    """
+    Сохранение манифеста (через временный файл, чтобы прерывание не испортило его).
+    """
+    temp_path = manifest_path + '.part'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=4, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+
+def pending_actions(entry, actions):
+    """
+    Действия, результатов которых ещё нет (или они не отмечены в манифесте как готовые).
+    """
+    done = entry.get("outputs", {}) if entry else {}
+    return [action for action in actions if not (action in done and os.path.exists(done[action]))]
+
+
+def merge_midi(manifest, output_path, tempo):
+    """
+    Объединение нот всех успешно обработанных файлов в один MIDI (трек на файл).
+    """
+    names, notes_list = [], []
+    for relative, entry in sorted(manifest["files"].items()):
+        notes_path = entry.get("notes_path")
+        if entry.get("status") == "ok" and notes_path and os.path.exists(notes_path):
+            names.append(relative)
+            notes_list.append(load_notes(notes_path))
+    merge_to_midi(notes_list, output_path, tempo, names)
+    print(f"Общий MIDI-файл ({len(notes_list)} треков): {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная конвертация аудиофайлов в MIDI, ноты и табулатуры.")
+    parser.add_argument('source', help="Папка с аудиофайлами или шаблон glob")
+    parser.add_argument('-o', '--output', default='batch_output', help="Папка для результатов")
+    parser.add_argument('-a', '--actions', nargs='+', default=['midi'], choices=sorted(RESULT_SUFFIXES), help="Какие результаты создавать")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Количество рабочих процессов")
+    parser.add_argument('-t', '--tempo', type=int, default=None, help="Темп (ударов в минуту; по умолчанию определяется по записи)")
+    parser.add_argument('--lilypond-processes', type=int, default=2, help="Одновременных процессов LilyPond")
+    parser.add_argument('--lilypond-batch', type=int, default=8, help="Документов в одном запуске LilyPond")
+    parser.add_argument('--pitch-backend', default=None, choices=['praat', 'yin'], help="Детектор высоты звука")
+    parser.add_argument('--chords', action='store_true', help="Распознавать аккорды (многоголосный режим)")
+    parser.add_argument('--json', action='store_true', help="Дополнительно сохранять ноты в JSON")
+    parser.add_argument('--merge-midi', default=None, help="Собрать все распознанные файлы в один многотрековый MIDI")
+    parser.add_argument('--manifest', default=None, help="Путь к манифесту (по умолчанию <output>/manifest.json)")
+    args = parser.parse_args()
+
+    base, files = find_inputs(args.source)
+    if not files:
+        print(f"Аудиофайлы не найдены: {args.source}")
+        return 1
+
+    output_root = os.path.abspath(args.output)
+    manifest_path = args.manifest or os.path.join(output_root, 'manifest.json')
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    manifest = load_manifest(manifest_path)
+    manifest.update({"source": args.source, "actions": args.actions, "tempo": args.tempo})
+
+    # Пропускаем файлы, для которых все результаты уже готовы
+    relatives = {input_path: os.path.relpath(input_path, base) for input_path in files}
+    try:
+        names = output_names(relatives.values())
+    except ValueError as e:
+        print(e)
+        return 1
+    tasks = {}
+    for input_path, relative in relatives.items():
+        actions = pending_actions(manifest["files"].get(relative), args.actions)
+        if actions:
+            output_folder = os.path.join(output_root, os.path.dirname(relative))
+            tasks[relative] = (input_path, output_folder, names[relative], actions)
+
+    print(f"Найдено файлов: {len(files)}, к обработке: {len(tasks)}, пропущено: {len(files) - len(tasks)}")
+
+    started = time.perf_counter()
+    # Файлы с ошибками (распознавания или рендеринга), каждый учитывается один раз
+    failed = set()
+    # PDF всех файлов рендерятся общими пакетами, пока идёт распознавание остальных
+    lilypond_service = LilyPondService(max_processes=args.lilypond_processes, max_batch=args.lilypond_batch)
+    renders = {}
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=prewarmed_context()) as executor:
+        futures = {
+            executor.submit(pipeline.convert_file, input_path, output_folder, actions, args.tempo, render=False, export_json=args.json, pitch_backend=args.pitch_backend,
+                            mode='chords' if args.chords else 'melody', file_name=file_name): relative
+            for relative, (input_path, output_folder, file_name, actions) in tasks.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            relative = futures[future]
+            entry = manifest["files"].setdefault(relative, {"outputs": {}, "timings": {}})
+            try:
+                result = future.result()
+            except Exception as e:
+                failed.add(relative)
+                entry.update({"status": "error", "error": str(e)})
+                print(f"[{done}/{len(tasks)}] ❌ {relative}: {e}")
+            else:
+                for action, output_path in result["outputs"].items():
+                    if pipeline.needs_rendering(output_path):
+                        pdf_path = os.path.splitext(output_path)[0] + '.pdf'
+                        renders[lilypond_service.submit(output_path, pdf_path)] = (relative, action)
+                    else:
+                        entry["outputs"][action] = output_path
+                entry["timings"].update(result["timings"])
+                entry.update({"status": "ok", "notes": result["notes"], "notes_path": result["notes_path"], "error": None, "errors": {}})
+                print(f"[{done}/{len(tasks)}] {relative}: {sum(result['timings'].values()):.2f} с")
+            # Манифест сохраняется после каждого файла, чтобы можно было продолжить после прерывания
+            save_manifest(manifest, manifest_path)
+
+    for future in as_completed(renders):
+        relative, action = renders[future]
+        entry = manifest["files"][relative]
+        try:
+            entry["outputs"][action] = future.result()
+        except Exception as e:
+            # Ошибка рендеринга относится только к одному действию: ноты и MIDI файла остаются годными
+            failed.add(relative)
+            entry.setdefault("errors", {})[action] = str(e)
+            print(f"❌ {relative} ({action}): {e}")
+        save_manifest(manifest, manifest_path)
+    if renders:
+        print(f"LilyPond: {lilypond_service.stats()}")
+
+    if args.merge_midi:
+        merge_midi(manifest, args.merge_midi, args.tempo)
+
+    manifest["last_run"] = {"files": len(tasks), "failed": sorted(failed), "seconds": time.perf_counter() - started}
+    save_manifest(manifest, manifest_path)
+    print(f"Готово: {len(tasks) - len(failed)} из {len(tasks)}, манифест: {manifest_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
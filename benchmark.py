@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+import numpy as np
+
+# Модули конвейера из папки scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+import parselmouth
+import recognition
+import onsets as onset_detection
+import decode_audio
+from classes.notes import Notes
+from notes_to_midi import notes_to_midi
+from notes_to_sheet_music import notes_to_sheet_music
+from notes_to_tabs import notes_to_tabs
+
+# Ноты синтетической мелодии (в пределах гитарного диапазона E2–E6)
+MELODY_HZ = [82.41, 110.0, 146.83, 196.0, 246.94, 329.63, 440.0, 659.26]
+
+# Этапы конвейера в порядке выполнения
+STAGES = ['decode', 'to_pitch', 'to_intensity', 'onsets', 'tempo', 'segmentation', 'notes_to_midi', 'notes_to_sheet_music', 'notes_to_tabs']
+
+
+def generate_wav(path, seconds, timbre='guitar', sample_rate=44100, note_length=0.5):
+    """
+    Создание синтетического WAV-файла с мелодией из известных нот.
+    Файл пишется блоками, поэтому длинные записи не занимают память целиком.
+
+    :param path: Путь к WAV-файлу.
+    :param seconds: Длина записи (в секундах).
+    :param timbre: 'sine' — чистый тон, 'guitar' — гармоники с затуханием.
+    :param sample_rate: Частота дискретизации (Гц).
+    :param note_length: Длина каждой ноты (в секундах).
+    """
+    note_samples = int(note_length * sample_rate)
+    t = np.arange(note_samples) / sample_rate
+    if timbre == 'sine':
+        harmonics, envelope = [1.0], np.ones(note_samples)
+    else:
+        harmonics, envelope = [1.0, 0.5, 0.33, 0.25, 0.2], np.exp(-3.0 * t)
+
+    # Заранее считаем отсчёты каждой ноты мелодии
+    notes = []
+    for hz in MELODY_HZ:
+        tone = sum(amplitude * np.sin(2 * np.pi * hz * (k + 1) * t) for k, amplitude in enumerate(harmonics))
+        notes.append((0.5 * envelope * tone / sum(harmonics) * 32767).astype('<i2').tobytes())
+
+    total_notes = int(np.ceil(seconds / note_length))
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        for i in range(total_notes):
+            wav.writeframes(notes[i % len(notes)])
+
+
+def reset_peak_rss():
+    """
+    Сброс пикового RSS процесса (Linux). Возвращает False, если сброс недоступен.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Пиковый RSS процесса (в МБ).
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss в килобайтах на Linux и в байтах на macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def measure(results, stage, fn, notes_count=None):
+    """
+    Замер одного этапа: время, пиковый RSS, нот в секунду.
+    Ошибка этапа (например, нет ffmpeg или LilyPond) записывается в результат.
+    """
+    reset_peak_rss()
+    start = time.perf_counter()
+    try:
+        value = fn()
+    except Exception as e:
+        results[stage] = {"error": str(e)}
+        print(f"  {stage:22s} ошибка: {e}")
+        return None
+    seconds = time.perf_counter() - start
+    if notes_count is None and isinstance(value, list):
+        notes_count = len(value)
+    results[stage] = {
+        "seconds": seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "notes_per_second": notes_count / seconds if notes_count and seconds > 0 else None
+    }
+    print(f"  {stage:22s} {seconds:9.4f} с  {results[stage]['peak_rss_mb']:8.1f} МБ")
+    return value
+
+
+def pitch_accuracy(snd, backend, note_length=0.5):
+    """
+    Сравнение детектора высоты с известными нотами синтетической мелодии.
+    Учитываются только кадры из середины нот (без атаки и границ соседних нот).
+
+    :param snd: Синтетическая запись (parselmouth.Sound).
+    :param backend: Имя или объект PitchBackend.
+    :param note_length: Длина каждой ноты мелодии (в секундах).
+    :return: Словарь: время, доля озвученных кадров, доля кадров в пределах 50 центов, медианная ошибка.
+    """
+    backend = recognition.get_pitch_backend(backend)
+    start = time.perf_counter()
+    times, frequencies = backend.track(snd)
+    seconds = time.perf_counter() - start
+
+    position = (times - snd.xmin) / note_length
+    phase = position - np.floor(position)
+    middle = (phase > 0.2) & (phase < 0.8)
+    expected = np.array(MELODY_HZ)[np.floor(position[middle]).astype(int) % len(MELODY_HZ)]
+    detected = frequencies[middle]
+
+    voiced = detected > 0
+    cents = np.abs(1200 * np.log2(detected[voiced] / expected[voiced])) if voiced.any() else np.array([])
+    result = {
+        "seconds": seconds,
+        "voiced": float(voiced.mean()) if len(voiced) else None,
+        "within_50_cents": float((cents < 50).sum() / len(voiced)) if len(voiced) else None,
+        "median_cents": float(np.median(cents)) if len(cents) else None
+    }
+    print(f"  {backend.name:22s} {seconds:9.4f} с  озвучено {result['voiced']:.1%}  "
+          f"в пределах 50 центов {result['within_50_cents']:.1%}")
+    return result
+
+
+def benchmark_file(wav_path, stages, tempo=None, pitch_backend=None, compare_backends=()):
+    """
+    Замер всех этапов конвейера на одном файле.
+
+    :param tempo: Темп для сегментации; None — оценка по кривой новизны (этап tempo).
+
+    :param pitch_backend: Детектор высоты для этапа to_pitch.
+    :param compare_backends: Детекторы высоты для сравнения точности и скорости.
+    """
+    results = {}
+    output_folder = tempfile.mkdtemp(prefix='barddo_bench_')
+
+    # Декодирование: через ffmpeg (как в боте) или чтением WAV, если ffmpeg нет
+    snd = None
+    if 'decode' in stages:
+        snd = measure(results, 'decode', lambda: decode_audio.load_sound(wav_path))
+    if snd is None:
+        snd = parselmouth.Sound(wav_path)
+
+    backend = recognition.get_pitch_backend(pitch_backend)
+    pitch = measure(results, 'to_pitch', lambda: backend.track(snd)) if 'to_pitch' in stages else backend.track(snd)
+    intensity = measure(results, 'to_intensity', snd.to_intensity) if 'to_intensity' in stages else snd.to_intensity()
+    analysis = measure(results, 'onsets', lambda: onset_detection.analyze_onsets(snd)) if 'onsets' in stages else onset_detection.analyze_onsets(snd)
+    onsets = analysis["onsets"]
+    estimate = lambda: onset_detection.estimate_tempo(analysis["onset_envelope"])
+    estimated_tempo = measure(results, 'tempo', estimate) if 'tempo' in stages else estimate()
+    tempo = tempo or estimated_tempo
+
+    def segmentation():
+        times, frequencies = pitch
+        return recognition.notes_from_contours(times, frequencies, recognition.intensity_at(times, intensity), tempo, onsets=onsets)
+
+    notes_data = measure(results, 'segmentation', segmentation) if 'segmentation' in stages else segmentation()
+    notes = Notes.from_json({"notesArray": notes_data or []})
+
+    renderers = {
+        'notes_to_midi': (notes_to_midi, '_MIDI.mid'),
+        'notes_to_sheet_music': (notes_to_sheet_music, '_NOTES.pdf'),
+        'notes_to_tabs': (notes_to_tabs, '_TABS.pdf')
+    }
+    for stage, (renderer, suffix) in renderers.items():
+        if stage in stages:
+            output_path = os.path.join(output_folder, 'bench' + suffix)
+            measure(results, stage, lambda: renderer(notes, output_path), notes_count=len(notes))
+
+    if compare_backends:
+        results["pitch_backends"] = {
+            recognition.get_pitch_backend(name).name: pitch_accuracy(snd, name) for name in compare_backends
+        }
+
+    results["pitch_backend"] = backend.name
+    results["notes"] = len(notes)
+    results["tempo"] = estimated_tempo
+    return results
+
+
+def git_commit():
+    """
+    Текущий коммит репозитория (для сравнения результатов между коммитами).
+    """
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline_path):
+    """
+    Печать отношения времени этапов к сохранённому результату.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    print(f"\nСравнение с {baseline_path} (коммит {baseline.get('commit')}): время / базовое время")
+    for length, stages in current["results"].items():
+        base_stages = baseline.get("results", {}).get(length, {})
+        for stage in STAGES:
+            now, before = stages.get(stage, {}), base_stages.get(stage, {})
+            if now.get("seconds") and before.get("seconds"):
+                print(f"  {length:>6s} с  {stage:22s} x{now['seconds'] / before['seconds']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер производительности конвейера распознавания и генерации.")
+    parser.add_argument('-l', '--lengths', type=float, nargs='+', default=[10, 60, 300], help="Длины синтетических записей (в секундах)")
+    parser.add_argument('--timbre', choices=['sine', 'guitar'], default='guitar', help="Тембр синтетических нот")
+    parser.add_argument('-s', '--stages', nargs='+', default=STAGES, choices=STAGES, help="Какие этапы замерять")
+    parser.add_argument('--pitch-backend', default=None, choices=sorted(recognition.PITCH_BACKENDS), help="Детектор высоты для этапа to_pitch")
+    parser.add_argument('--pitch-backends', nargs='*', default=None, choices=sorted(recognition.PITCH_BACKENDS),
+                        help="Сравнить точность и скорость детекторов высоты (без значений — все)")
+    parser.add_argument('-o', '--output', default=None, help="Путь к JSON с результатами (по умолчанию bench_results/<коммит>.json)")
+    parser.add_argument('--compare', default=None, help="JSON предыдущего запуска для сравнения")
+    parser.add_argument('--keep-inputs', default=None, help="Папка для синтетических WAV (по умолчанию временная)")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    input_folder = args.keep_inputs or tempfile.mkdtemp(prefix='barddo_bench_inputs_')
+    os.makedirs(input_folder, exist_ok=True)
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timbre": args.timbre,
+        "results": {}
+    }
+
+    compare_backends = sorted(recognition.PITCH_BACKENDS) if args.pitch_backends == [] else (args.pitch_backends or ())
+
+    for seconds in args.lengths:
+        wav_path = os.path.join(input_folder, f"{args.timbre}_{seconds:g}s.wav")
+        if not os.path.exists(wav_path):
+            generate_wav(wav_path, seconds, args.timbre)
+        print(f"{seconds:g} с ({wav_path}):")
+        report["results"][f"{seconds:g}"] = benchmark_file(wav_path, args.stages, pitch_backend=args.pitch_backend,
+                                                            compare_backends=compare_backends)
+
+    output_path = args.output or os.path.join('bench_results', f"{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=4, ensure_ascii=False)
+    print(f"Результаты сохранены: {output_path}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,106 @@
 import os
-import subprocess
-import telebot
-from telebot import types
-import scripts.classes.storage as storage
-
-bot = telebot.TeleBot('')
-
-user_files = {}
-
-# Папка для сохранения файлов
-input_folder = os.path.join(os.getcwd(), 'input')
-
-# Убедимся, что папка существует
-if not os.path.exists(input_folder):
-    os.makedirs(input_folder)
+import sys
+import time
+import asyncio
+from telebot.async_telebot import AsyncTeleBot
+from telebot import types, asyncio_helper
+
+# Модули конвейера загружаются один раз при старте бота
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+import pipeline
+from classes.job import Job
+from job_queue import JobQueue, QueueFullError, UserLimitError
+from lilypond_service import LilyPondService
+from metrics import Metrics, StageTimer, start_http_server, log_json
+
+bot = AsyncTeleBot('')
+
+# Размер блока при потоковом скачивании файлов (в байтах)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Настройки пула рабочих процессов
+WORKERS = int(os.environ.get('BARDDO_WORKERS', 2))  # Количество рабочих процессов
+MAX_QUEUE = int(os.environ.get('BARDDO_MAX_QUEUE', 20))  # Максимальная длина очереди
+PER_USER_LIMIT = int(os.environ.get('BARDDO_PER_USER_LIMIT', 2))  # Заданий на одного пользователя
+
+# Настройки рендеринга PDF
+LILYPOND_PROCESSES = int(os.environ.get('BARDDO_LILYPOND_PROCESSES', 2))  # Одновременных процессов LilyPond
+LILYPOND_BATCH = int(os.environ.get('BARDDO_LILYPOND_BATCH', 8))  # Документов в одном запуске LilyPond
+
+# Порт HTTP-сервера метрик Prometheus (только локальный адрес; 0 — не запускать)
+METRICS_PORT = int(os.environ.get('BARDDO_METRICS_PORT', 9108))
+
+# Метрики бота; показатели очередей объявляются при запуске, когда очереди созданы
+metrics = Metrics()
+metrics.counter('jobs_total', "Заданий поставлено в очередь")
+metrics.counter('job_failures_total', "Заданий завершилось ошибкой")
+metrics.counter('jobs_rejected_total', "Заданий отклонено (очередь заполнена или превышен лимит пользователя)")
+metrics.counter('cache_lookups_total', "Обращений к кэшам контуров и результатов")
+metrics.histogram('stage_seconds', "Время этапов обработки (в секундах)")
+metrics.histogram('job_seconds', "Время задания от постановки в очередь до отправки результата (в секундах)")
+
+# Очередь заданий и сервис LilyPond создаются при запуске бота
+job_queue = None
+lilypond_service = None
+
+# Текущее задание (Job) каждого пользователя
+user_jobs = {}
+
+# Количество действий в очереди для каждого задания; файлы задания удаляются,
+# только когда оно заменено новым файлом и все его действия завершены.
+# Все обработчики выполняются в одном цикле событий, поэтому блокировки не нужны.
+pending_actions = {}
+retired_jobs = set()
+
+# Задачи доставки результатов (храним ссылки, чтобы задачи не удалил сборщик мусора)
+delivery_tasks = set()
+
+async def retire_job(job):
+    """
+    Удаление файлов задания (сразу или после завершения его действий).
+    """
+    if pending_actions.get(job.job_id):
+        retired_jobs.add(job.job_id)
+        return
+    await asyncio.to_thread(job.cleanup)
 
-def exec_script(script_path):
+async def finish_action(job):
     """
-    Выполнение Python-скрипта через subprocess.
-    Возвращает True, если выполнение прошло успешно, иначе False.
+    Учёт завершения действия задания.
     """
-    try:
-        script_dir, script_name = os.path.split(script_path)
-        command = f'cd "{script_dir}" && python "{script_name}"'
-
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"Скрипт {script_name} успешно выполнен.")
-            return True
-        else:
-            print(f"Ошибка выполнения {script_name}: {result.stderr}")
-            return False
-    except Exception as e:
-        print(f"Ошибка выполнения скрипта {script_path}: {e}")
-        return False
+    pending_actions[job.job_id] -= 1
+    if pending_actions[job.job_id]:
+        return
+    del pending_actions[job.job_id]
+    if job.job_id in retired_jobs:
+        retired_jobs.discard(job.job_id)
+        await asyncio.to_thread(job.cleanup)
 
-def send_result_file(chat_id, result_file_path, file_caption):
+async def download_to_file(server_file_path, target_path):
+    """
+    Потоковое скачивание файла Telegram на диск блоками (файл не хранится в памяти целиком).
+    """
+    url = (asyncio_helper.FILE_URL or "https://api.telegram.org/file/bot{0}/{1}").format(bot.token, server_file_path)
+    session = await asyncio_helper.session_manager.get_session()
+    async with session.get(url, proxy=asyncio_helper.proxy) as response:
+        if response.status != 200:
+            raise RuntimeError(f"Ошибка скачивания файла: HTTP {response.status}")
+        with open(target_path, 'wb') as new_file:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                new_file.write(chunk)
+
+async def send_result_file(chat_id, result_file_path, file_caption):
     """
     Отправка файла результата пользователю.
     """
     try:
         with open(result_file_path, 'rb') as file:
-            bot.send_document(chat_id, file, caption=file_caption)
+            await bot.send_document(chat_id, file, caption=file_caption)
     except Exception as e:
         print(f"Ошибка при отправке файла: {e}")
-        bot.send_message(chat_id, f"❌ Ошибка при отправке файла: {e}")
+        await bot.send_message(chat_id, f"❌ Ошибка при отправке файла: {e}")
 
-def show_main_menu(chat_id):
+async def show_main_menu(chat_id):
     """
     Главное меню с кнопками "Начать", "FAQ", "Поддержка".
     """
@@ -57,155 +111,210 @@ def show_main_menu(chat_id):
     markup.row(btn1)
     markup.row(btn2, btn3)
 
-    file = open('photo.jpg', 'rb')  # Изображение для приветственного сообщения
-    bot.send_photo(
-        chat_id,
-        file,
-        caption='🎵 Привет, я твой музыкальный помощник!\n\n'
-                'Готов помочь с:\n'
-                '- Преобразованием в MIDI\n'
-                '- Созданием нот\n'
-                '- Построением табулатур.\n\n'
-                '🚀 Нажмите "Начать", чтобы загрузить файл.',
-        parse_mode='html',
-        reply_markup=markup
-    )
-
-def show_info(chat_id):
+    with open('photo.jpg', 'rb') as file:  # Изображение для приветственного сообщения
+        await bot.send_photo(
+            chat_id,
+            file,
+            caption='🎵 Привет, я твой музыкальный помощник!\n\n'
+                    'Готов помочь с:\n'
+                    '- Преобразованием в MIDI\n'
+                    '- Созданием нот\n'
+                    '- Построением табулатур.\n\n'
+                    '🚀 Нажмите "Начать", чтобы загрузить файл.',
+            parse_mode='html',
+            reply_markup=markup
+        )
+
+async def show_info(chat_id):
     """
     Меню FAQ.
     """
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton('⬅️ Назад', callback_data='main_menu'))
-    bot.send_message(chat_id, 'ℹ️ FAQ: Нажмите кнопку начать, скиньте файл и выберите что вам нужно.', reply_markup=markup)
+    await bot.send_message(chat_id, 'ℹ️ FAQ: Нажмите кнопку начать, скиньте файл и выберите что вам нужно.', reply_markup=markup)
 
-def show_help(chat_id):
+async def show_help(chat_id):
     """
     Меню поддержки.
     """
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton('⬅️ Назад', callback_data='main_menu'))
-    bot.send_message(chat_id, '✍️ Напишите нам: @Gr0G0R', reply_markup=markup)
+    await bot.send_message(chat_id, '✍️ Напишите нам: @Gr0G0R', reply_markup=markup)
 
-def show_go(chat_id):
+async def show_go(chat_id):
     """
     Меню выбора действия с загруженным файлом.
     """
+    chords = chat_id in user_jobs and user_jobs[chat_id].mode == 'chords'
     markup = types.InlineKeyboardMarkup()
     btn1 = types.InlineKeyboardButton('🔄 Преобразовать в MIDI', callback_data='midi')
     btn2 = types.InlineKeyboardButton('🎼 Создать ноты', callback_data='nots')
     btn3 = types.InlineKeyboardButton('🎸 Построить табулатуры', callback_data='tabulatures')
-    btn4 = types.InlineKeyboardButton('⬅️ Назад', callback_data='main_menu')
-    markup.add(btn1, btn2, btn3, btn4)
+    btn4 = types.InlineKeyboardButton('🎹 Режим: аккорды' if chords else '🎵 Режим: мелодия', callback_data='mode')
+    btn5 = types.InlineKeyboardButton('⬅️ Назад', callback_data='main_menu')
+    markup.add(btn1, btn2, btn3, btn4, btn5)
 
-    bot.send_message(
+    await bot.send_message(
         chat_id,
         '🎶 Файл загружен! Выберите действие:',
         parse_mode='html',
         reply_markup=markup
     )
 
-def process_action(action, chat_id):
+async def show_retry(chat_id, action):
     """
-    Обработка действий (MIDI, ноты, табулатуры).
+    Предложение повторить распознавание с большей чувствительностью.
+    Анализ звука сохранён, поэтому повтор выполняется почти мгновенно.
     """
-    scripts = {
-        'midi': 'scripts/notes_to_midi.py',
-        'nots': 'scripts/notes_to_sheet_music.py',
-        'tabulatures': 'scripts/notes_to_tabs.py'
-    }
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton('🔁 Чувствительнее', callback_data=f'sensitive_{action}'))
+    await bot.send_message(chat_id, 'Не хватает тихих или коротких нот? Попробуйте ещё раз с большей чувствительностью.', reply_markup=markup)
 
-    if chat_id not in user_files:
-        bot.send_message(chat_id, "❌ Сначала загрузите файл.")
+async def retry_more_sensitive(action, chat_id):
+    """
+    Повтор действия с пониженными порогами распознавания.
+    """
+    if chat_id not in user_jobs:
+        await bot.send_message(chat_id, "❌ Сначала загрузите файл.")
         return
+    job = user_jobs[chat_id]
+    job.params = pipeline.more_sensitive(job.params, job.mode)
+    await process_action(action, chat_id)
 
-    file_info = user_files[chat_id]
-    file_name = file_info['file_name']
-    storage.save_file_name(file_name)
+async def toggle_mode(chat_id):
+    """
+    Переключение режима распознавания: мелодия (одна нота за раз) или аккорды.
+    """
+    if chat_id not in user_jobs:
+        await bot.send_message(chat_id, "❌ Сначала загрузите файл.")
+        return
+    job = user_jobs[chat_id]
+    job.mode = 'melody' if job.mode == 'chords' else 'chords'
+    job.params = {}  # Пороги одного режима не подходят другому
+    await show_go(chat_id)
 
-    recognition_script = os.path.join(os.getcwd(), 'scripts', 'recognition.py')
-    if not os.path.exists(recognition_script):
-        bot.send_message(chat_id, "❌ Скрипт распознавания не найден.")
+async def process_action(action, chat_id):
+    """
+    Обработка действий (MIDI, ноты, табулатуры).
+    Задание только ставится в очередь, результат отправляется по готовности.
+    """
+    if action not in pipeline.ACTIONS:
+        await bot.send_message(chat_id, "❌ Неверное действие.")
         return
 
-    # Шаг 1: Запуск скрипта распознавания
-    bot.send_message(chat_id, "🔄 Запуск распознавания...")
-    if not exec_script(recognition_script):
-        bot.send_message(chat_id, "❌ Ошибка распознавания файла.")
+    if chat_id not in user_jobs:
+        await bot.send_message(chat_id, "❌ Сначала загрузите файл.")
         return
 
-    # Шаг 2: Запуск выбранного действия
-    if action in scripts:
-        action_script = os.path.join(os.getcwd(), scripts[action])
-        bot.send_message(chat_id, f"🔄 Выполнение действия: {action}...")
-        if not exec_script(action_script):
-            bot.send_message(chat_id, f"❌ Ошибка выполнения действия: {action}.")
-            return
+    job = user_jobs[chat_id]
 
-        file_name = storage.load_file_name()
+    try:
+        # PDF рендерит общий сервис LilyPond, рабочий процесс только готовит код
+        position, future = job_queue.submit(chat_id, pipeline.run_job_timed, job, action, params=job.params, render=False, mode=job.mode)
+    except QueueFullError:
+        metrics.inc('jobs_rejected_total', reason='queue_full')
+        await bot.send_message(chat_id, "⏳ Сейчас слишком много заданий, попробуйте чуть позже.")
+        return
+    except UserLimitError:
+        metrics.inc('jobs_rejected_total', reason='user_limit')
+        await bot.send_message(chat_id, "⏳ Дождитесь завершения ваших текущих заданий.")
+        return
 
-        result_files = {
-            'midi': f'output/{file_name}_MIDI.mid',
-            'nots': f'output/{file_name}_NOTES.pdf',
-            'tabulatures': f'output/{file_name}_TABS.pdf'
-        }
+    pending_actions[job.job_id] = pending_actions.get(job.job_id, 0) + 1
+    metrics.inc('jobs_total', action=action, mode=job.mode)
 
-        result_file_path = os.path.join(os.getcwd(), result_files[action])
-        send_result_file(chat_id, result_file_path, f"Вот ваш результат: {action}!")
+    print(f"Задание {job} ({action}) в очереди, позиция {position}. Состояние: {job_queue.stats()}")
+    task = asyncio.create_task(deliver_result(asyncio.wrap_future(future), chat_id, job, action, time.perf_counter()))
+    delivery_tasks.add(task)
+    task.add_done_callback(delivery_tasks.discard)
+    if position:
+        await bot.send_message(chat_id, f"⏳ В очереди, позиция {position}")
     else:
-        bot.send_message(chat_id, "❌ Неверное действие.")
+        await bot.send_message(chat_id, "⚙️ Задание обрабатывается...")
 
-def convert_to_wav(file_path):
+async def deliver_result(future, chat_id, job, action, submitted):
     """
-    Конвертация файла в формат WAV с помощью ffmpeg.
-    Заменяет исходный файл на WAV.
+    Ожидание завершения задания в пуле процессов и отправка результата пользователю.
+    Время этапов (рабочего процесса, LilyPond, отправки) попадает в метрики
+    и в строку JSON-лога задания.
+
+    :param submitted: Время постановки в очередь (time.perf_counter()).
     """
+    timer = StageTimer()
+    error = None
     try:
-        # Формируем путь для выходного WAV
-        output_file = os.path.splitext(file_path)[0] + '.wav'
-
-        # Конвертация в формат WAV
-        command = f'ffmpeg -y -i "{file_path}" -vn -acodec pcm_s16le -ar 44100 -ac 2 "{output_file}"'
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            print(f"Ошибка при конвертации: {result.stderr}")
-            return None
-
-        print(f"Файл успешно преобразован в WAV: {output_file}")
-
-        # Удаляем исходный файл
-        os.remove(file_path)
-        print(f"Удалён исходный файл: {file_path}")
-
-        return output_file
+        result = await future
+        timer.timings.update(result["timings"])
+        timer.events.update(result["events"])
+        result_file_path = result["path"]
+        if pipeline.needs_rendering(result_file_path):
+            # PDF рендерится в папку варианта: одновременные действия задания не мешают друг другу
+            with timer.stage('lilypond'):
+                result_file_path = await asyncio.wrap_future(lilypond_service.submit(result_file_path, job.result_path(action, result["key"])))
+            print(f"PDF для {job} готов. LilyPond: {lilypond_service.stats()}")
+            await asyncio.to_thread(pipeline.cache_result, job, action, result["key"])
+        with timer.stage('upload'):
+            await send_result_file(chat_id, result_file_path, f"Вот ваш результат: {action}!")
+        await show_retry(chat_id, action)
     except Exception as e:
-        print(f"Ошибка при конвертации файла {file_path}: {e}")
-        return None
+        error = str(e)
+        print(f"Ошибка выполнения действия {action} для {job}: {e}")
+        await bot.send_message(chat_id, f"❌ Ошибка выполнения действия: {action}.")
+    finally:
+        await finish_action(job)
+        record_job(job, action, timer, time.perf_counter() - submitted, error)
+
+def record_job(job, action, timer, seconds, error=None):
+    """
+    Учёт завершённого задания в метриках и строка JSON-лога.
+    """
+    metrics.observe_timer('stage_seconds', timer)
+    metrics.observe('job_seconds', seconds, action=action)
+    if error is not None:
+        metrics.inc('job_failures_total', action=action, mode=job.mode)
+    for event, count in timer.events.items():
+        cache, result = event.rsplit('_', 1)
+        metrics.inc('cache_lookups_total', count, cache=cache, result=result)
+    log_json({
+        "event": "job",
+        "job_id": job.job_id,
+        "chat_id": job.chat_id,
+        "action": action,
+        "mode": job.mode,
+        "status": "error" if error is not None else "ok",
+        "error": error,
+        "seconds": round(seconds, 4),
+        "timings": {stage: round(value, 4) for stage, value in timer.timings.items()},
+        "events": timer.events
+    })
 
 
 @bot.callback_query_handler(func=lambda callback: True)
-def handle_callback(callback):
+async def handle_callback(callback):
     chat_id = callback.message.chat.id
-    bot.delete_message(chat_id, callback.message.message_id)
+    await bot.delete_message(chat_id, callback.message.message_id)
 
     if callback.data == 'go':
-        bot.send_message(chat_id, "🎶 Загрузите аудиофайл или голосовое сообщение.")
+        await bot.send_message(chat_id, "🎶 Загрузите аудиофайл или голосовое сообщение.")
     elif callback.data == 'info':
-        show_info(chat_id)
+        await show_info(chat_id)
     elif callback.data == 'help':
-        show_help(chat_id)
+        await show_help(chat_id)
     elif callback.data == 'main_menu':
-        show_main_menu(chat_id)
+        await show_main_menu(chat_id)
     elif callback.data in ['midi', 'nots', 'tabulatures']:
-        process_action(callback.data, chat_id)
+        await process_action(callback.data, chat_id)
+    elif callback.data == 'mode':
+        await toggle_mode(chat_id)
+    elif callback.data.startswith('sensitive_'):
+        await retry_more_sensitive(callback.data[len('sensitive_'):], chat_id)
 
 @bot.message_handler(commands=['start', 'menu'])
-def start(message):
-    show_main_menu(message.chat.id)
+async def start(message):
+    await show_main_menu(message.chat.id)
 
 @bot.message_handler(content_types=['audio', 'document', 'voice'])
-def handle_file(message):
+async def handle_file(message):
     chat_id = message.chat.id
     file_id = None
     file_name = None
@@ -222,30 +331,46 @@ def handle_file(message):
         file_id = message.voice.file_id
 
     if file_id and file_name:
-        file_info = bot.get_file(file_id)
-        file_path = os.path.join(input_folder, file_name)
-
-        # Скачиваем файл
-        downloaded_file = bot.download_file(file_info.file_path)
-        with open(file_path, 'wb') as new_file:
-            new_file.write(downloaded_file)
-
-        # Если файл MP3 или OGG, конвертируем в WAV
-        if file_name.endswith(('.mp3', '.ogg')):
-            converted_file = convert_to_wav(file_path)
-            if converted_file:
-                user_files[chat_id] = {'file_id': file_id, 'file_name': os.path.basename(converted_file)}
-                bot.reply_to(message, f"Файл {file_name} преобразован в WAV. Выберите действие!")
-                show_go(chat_id)
-            else:
-                bot.reply_to(message, "❌ Ошибка при конвертации файла.")
-        elif file_name.endswith('.wav'):
-            user_files[chat_id] = {'file_id': file_id, 'file_name': file_name}
-            bot.reply_to(message, f"Файл {file_name} получен. Выберите действие!")
-            show_go(chat_id)
-        else:
-            bot.reply_to(message, "❌ Неподдерживаемый формат файла. Пожалуйста, загрузите MP3, WAV или OGG.")
-    else:
-        bot.reply_to(message, "❌ Не удалось обработать файл. Попробуйте ещё раз.")
+        # Проверяем формат (декодирование выполняется в рабочем процессе)
+        if not file_name.endswith(('.mp3', '.ogg', '.wav')):
+            await bot.reply_to(message, "❌ Неподдерживаемый формат файла. Пожалуйста, загрузите MP3, WAV или OGG.")
+            return
 
-bot.polling(none_stop=True)
+        # Новое задание со своими папками; предыдущее задание пользователя удаляем
+        if chat_id in user_jobs:
+            await retire_job(user_jobs.pop(chat_id))
+        job = Job(file_name, chat_id=chat_id)
+        job.prepare()
+
+        # Скачиваем файл блоками прямо на диск
+        start = time.perf_counter()
+        try:
+            file_info = await bot.get_file(file_id)
+            await download_to_file(file_info.file_path, job.input_path)
+            seconds = time.perf_counter() - start
+            metrics.observe('stage_seconds', seconds, stage='download')
+            log_json({"event": "download", "job_id": job.job_id, "chat_id": chat_id, "seconds": round(seconds, 4),
+                      "bytes": os.path.getsize(job.input_path)})
+        except Exception as e:
+            print(f"Ошибка скачивания файла {file_name}: {e}")
+            await asyncio.to_thread(job.cleanup)
+            await bot.reply_to(message, "❌ Не удалось скачать файл. Попробуйте ещё раз.")
+            return
+
+        user_jobs[chat_id] = job
+        await bot.reply_to(message, f"Файл {file_name} получен. Выберите действие!")
+        await show_go(chat_id)
+    else:
+        await bot.reply_to(message, "❌ Не удалось обработать файл. Попробуйте ещё раз.")
+
+if __name__ == "__main__":
+    job_queue = JobQueue(workers=WORKERS, max_queue=MAX_QUEUE, per_user_limit=PER_USER_LIMIT)
+    lilypond_service = LilyPondService(max_processes=LILYPOND_PROCESSES, max_batch=LILYPOND_BATCH)
+    metrics.gauge('queue_depth', "Заданий, ожидающих в очереди", lambda: job_queue.stats()["depth"], queue='jobs')
+    metrics.gauge('queue_depth', "Заданий, ожидающих в очереди", lambda: lilypond_service.stats()["depth"], queue='lilypond')
+    metrics.gauge('in_flight', "Заданий, выполняющихся сейчас", lambda: job_queue.stats()["in_flight"], queue='jobs')
+    metrics.gauge('in_flight', "Заданий, выполняющихся сейчас", lambda: lilypond_service.stats()["in_flight"], queue='lilypond')
+    if METRICS_PORT:
+        start_http_server(metrics, METRICS_PORT)
+        print(f"Метрики: http://127.0.0.1:{METRICS_PORT}/metrics")
+    asyncio.run(bot.infinity_polling())
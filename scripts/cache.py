@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+import numpy as np
+
+
+class ResultCache:
+    """
+    Кэш файлов на диске с адресацией по содержимому.
+
+    Файлы хранятся под именем ключа; при превышении общего размера удаляются
+    давно не использованные (время последнего использования — mtime файла).
+    Папку могут использовать несколько процессов одновременно: запись идёт
+    через временный файл и атомарное переименование.
+    """
+    def __init__(self, folder: str, max_bytes: int = 500 * 1024 * 1024):
+        """
+        Инициализация кэша.
+
+        :param folder: Папка кэша.
+        :param max_bytes: Максимальный общий размер файлов кэша (в байтах).
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.folder, f"{key}{suffix}")
+
+    def get(self, key: str, suffix: str = '') -> str:
+        """
+        Поиск файла в кэше.
+
+        :param key: Ключ (хэш содержимого и параметров).
+        :param suffix: Расширение файла.
+        :return: Путь к файлу в кэше или None, если файла нет.
+        """
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)  # Отмечаем использование для LRU
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, source_path: str, suffix: str = '') -> str:
+        """
+        Сохранение копии файла в кэш.
+
+        :param key: Ключ (хэш содержимого и параметров).
+        :param source_path: Путь к сохраняемому файлу.
+        :param suffix: Расширение файла.
+        :return: Путь к файлу в кэше.
+        """
+        path = self._path(key, suffix)
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, path)
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """
+        Удаление давно не использованных файлов, пока кэш больше max_bytes.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or entry.name.endswith('.part'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self) -> dict:
+        """
+        Счётчики попаданий и промахов.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def audio_key(samples, sample_rate: int, params: dict) -> str:
+    """
+    Ключ кэша нот: хэш декодированного аудио и параметров распознавания.
+
+    :param samples: Массив отсчётов (numpy).
+    :param sample_rate: Частота дискретизации (Гц).
+    :param params: Параметры распознавания (темп, пороги и т. д.).
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"sample_rate": sample_rate, "shape": list(samples.shape), "params": params}, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(samples))
+    return digest.hexdigest()
+
+
+def notes_key(notes, action: str) -> str:
+    """
+    Ключ кэша результатов: хэш нот, темпа и типа результата.
+
+    :param notes: Объект Notes (хэшируются его двоичные записи и темп).
+    :param action: Действие: 'midi', 'nots' или 'tabulatures'.
+    """
+    digest = hashlib.sha256()
+    digest.update(notes.to_records().tobytes())
+    digest.update(str(notes.tempo).encode())
+    digest.update(action.encode())
+    return digest.hexdigest()
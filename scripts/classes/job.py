@@ -0,0 +1,122 @@
+import os
+import sys
+import shutil
+import uuid
+
+# Суффиксы файлов результата для каждого действия
+RESULT_SUFFIXES = {
+    'midi': '_MIDI.mid',
+    'nots': '_NOTES.pdf',
+    'tabulatures': '_TABS.pdf'
+}
+
+
+class Job:
+    """
+    Контекст одного задания конвертации.
+
+    У каждого задания свой уникальный id и свои папки для входного файла,
+    промежуточных данных и результатов, поэтому задания разных пользователей
+    не мешают друг другу и не требуют общего файла состояния.
+    """
+    def __init__(self, file_name: str, root: str = None, job_id: str = None, chat_id: int = None):
+        """
+        Инициализация задания.
+
+        :param file_name: Имя загруженного файла (например, "song.mp3").
+        :param root: Корневая папка проекта (по умолчанию текущая директория).
+        :param job_id: Идентификатор задания (по умолчанию генерируется).
+        :param chat_id: Чат пользователя, которому принадлежит задание.
+        """
+        self.job_id = job_id or uuid.uuid4().hex
+        self.chat_id = chat_id
+        self.root = root or os.getcwd()
+        self.name = os.path.splitext(os.path.basename(file_name))[0]
+
+        self.input_folder = os.path.join(self.root, 'input', self.job_id)
+        self.data_folder = os.path.join(self.root, 'data', self.job_id)
+        self.output_folder = os.path.join(self.root, 'output', self.job_id)
+
+        # Путь к входному файлу (может поменяться после конвертации в WAV)
+        self.input_path = os.path.join(self.input_folder, os.path.basename(file_name))
+
+        # Режим распознавания ('melody' — мелодия, 'chords' — аккорды) и его параметры
+        # (поверх параметров по умолчанию)
+        self.mode = 'melody'
+        self.params = {}
+
+    @property
+    def notes_path(self) -> str:
+        """
+        Путь к промежуточному файлу с распознанными нотами (двоичный формат).
+        """
+        return os.path.join(self.data_folder, f"{self.name}_notes.bin")
+
+    def variant_folder(self, folder: str, key: str) -> str:
+        """
+        Папка одного варианта результата (ноты с определёнными параметрами и действие):
+        одновременные действия задания с разными параметрами или режимом пишут
+        файлы в разные папки и не перезаписывают друг друга.
+
+        :param folder: Папка задания (data_folder или output_folder).
+        :param key: Ключ результата (см. notes_key).
+        """
+        return os.path.join(folder, key[:16])
+
+    def notes_path_for(self, key: str) -> str:
+        """
+        Путь к файлу нот варианта с ключом key.
+        """
+        return os.path.join(self.variant_folder(self.data_folder, key), f"{self.name}_notes.bin")
+
+    @property
+    def contours_path(self) -> str:
+        """
+        Путь к сохранённым контурам высоты и интенсивности (.npz).
+        """
+        return os.path.join(self.data_folder, f"{self.name}_contours.npz")
+
+    @property
+    def candidates_path(self) -> str:
+        """
+        Путь к сохранённым кандидатам многоголосия для режима аккордов (.npz).
+        """
+        return os.path.join(self.data_folder, f"{self.name}_chords.npz")
+
+    def result_path(self, action: str, key: str = None) -> str:
+        """
+        Путь к файлу результата для действия.
+
+        :param action: Действие: 'midi', 'nots' или 'tabulatures'.
+        :param key: Ключ результата (см. notes_key); файл кладётся в папку варианта.
+        :return: Путь к файлу результата.
+        """
+        folder = self.output_folder if key is None else self.variant_folder(self.output_folder, key)
+        return os.path.join(folder, f"{self.name}{RESULT_SUFFIXES[action]}")
+
+    def prepare(self) -> None:
+        """
+        Создание папок задания.
+        """
+        for folder in (self.input_folder, self.data_folder, self.output_folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def cleanup(self) -> None:
+        """
+        Удаление всех файлов задания.
+        """
+        for folder in (self.input_folder, self.data_folder, self.output_folder):
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def __repr__(self) -> str:
+        return f"Job(job_id={self.job_id}, name={self.name}, chat_id={self.chat_id})"
+
+
+def file_name_from_argv() -> str:
+    """
+    Имя файла (без пути и расширения) из аргументов командной строки скрипта.
+    """
+    if len(sys.argv) < 2:
+        print(f"Использование: python {os.path.basename(sys.argv[0])} <имя_файла>")
+        sys.exit(1)
+    return os.path.splitext(os.path.basename(sys.argv[1]))[0]
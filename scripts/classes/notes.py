@@ -1,9 +1,78 @@
+import re
+import json
+import struct
 from typing import List, Dict
+import numpy as np
+
+# Названия нот в октаве (индекс = MIDI-номер % 12)
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Смещение ноты от C внутри октавы (включая бемоли)
+NOTE_BASE = {"C": 0, "C#": 1, "Db": 1, "D": 2, "D#": 3, "Eb": 3, "E": 4, "F": 5, "F#": 6, "Gb": 6,
+             "G": 7, "G#": 8, "Ab": 8, "A": 9, "A#": 10, "Bb": 10, "B": 11}
+
+# Нота и октава (октава может быть многозначной или отрицательной: "C10", "C-1")
+PITCH_PATTERN = re.compile(r"^([A-Ga-g][#b]?)(-?\d+)$")
+
+# Темп по умолчанию (ударов в минуту), если темп нот не задан
+DEFAULT_TEMPO = 120
+
+# Двоичный формат нот: заголовок фиксированного размера и массив записей одинаковой длины.
+# Заголовок: сигнатура, версия формата, размер записи, количество нот, темп
+# (0 — не задан; в файлах без темпа на этом месте нулевое дополнение заголовка).
+NOTES_MAGIC = b"BARDNOTE"
+NOTES_VERSION = 1
+NOTES_HEADER = struct.Struct("<8sHHQf")
+NOTES_HEADER_SIZE = 32
+NOTE_RECORD = np.dtype([
+    ("onset", "<f8"),
+    ("duration", "<f8"),
+    ("midi", "<i2"),
+    ("velocity", "u1"),
+    ("reserved", "V5")
+])
+
+
+def note_to_midi_number(pitch: str) -> int:
+    """
+    Преобразование названия ноты в MIDI-номер.
+
+    :param pitch: Нота (например, "C4", "D#5").
+    :return: MIDI-номер (C4 = 60).
+    """
+    match = PITCH_PATTERN.match(pitch)
+    if not match:
+        raise ValueError(f"Неверная нота: {pitch}")
+    name, octave = match.groups()
+    return 12 * (int(octave) + 1) + NOTE_BASE[name[0].upper() + name[1:]]
+
+
+def midi_number_to_note(midi_number: int) -> str:
+    """
+    Преобразование MIDI-номера в название ноты.
+
+    :param midi_number: MIDI-номер (например, 69).
+    :return: Нота (например, "A4").
+    """
+    return f"{NOTE_NAMES[midi_number % 12]}{midi_number // 12 - 1}"
+
+
+def load_notes(path: str) -> "Notes":
+    """
+    Загрузка нот из двоичного файла или JSON (формат определяется автоматически).
+    """
+    return Notes.load(path)
+
 
 class Note:
     """
     Класс, представляющий ноту.
+
+    Нота — это представление одной строки массивов Notes: значения хранятся
+    в массивах, а у объекта нет собственного __dict__.
     """
+    __slots__ = ("_notes", "_index")
+
     def __init__(self, pitch: str, duration: float, velocity: int = 100):
         """
         Инициализация ноты.
@@ -12,9 +81,55 @@ class Note:
         :param duration: Длительность ноты (в долях такта).
         :param velocity: Сила нажатия клавиши (по умолчанию 100).
         """
-        self.pitch = pitch
-        self.duration = duration
-        self.velocity = velocity
+        notes = Notes.from_arrays([note_to_midi_number(pitch)], [duration], [velocity])
+        self._notes = notes
+        self._index = 0
+
+    @classmethod
+    def view(cls, notes: "Notes", index: int) -> "Note":
+        """
+        Нота-представление строки index объекта Notes (без копирования данных).
+        """
+        note = cls.__new__(cls)
+        note._notes = notes
+        note._index = index
+        return note
+
+    @property
+    def midi(self) -> int:
+        return int(self._notes.midi[self._index])
+
+    @midi.setter
+    def midi(self, value: int):
+        self._notes.midi[self._index] = value
+
+    @property
+    def pitch(self) -> str:
+        return midi_number_to_note(self.midi)
+
+    @pitch.setter
+    def pitch(self, value: str):
+        self.midi = note_to_midi_number(value)
+
+    @property
+    def duration(self) -> float:
+        return float(self._notes.duration[self._index])
+
+    @duration.setter
+    def duration(self, value: float):
+        self._notes.duration[self._index] = value
+
+    @property
+    def velocity(self) -> int:
+        return int(self._notes.velocity[self._index])
+
+    @velocity.setter
+    def velocity(self, value: int):
+        self._notes.velocity[self._index] = value
+
+    @property
+    def onset(self) -> float:
+        return float(self._notes.onset[self._index])
 
     def __repr__(self) -> str:
         return f"Note(pitch={self.pitch}, duration={self.duration}, velocity={self.velocity})"
@@ -23,14 +138,51 @@ class Note:
 class Notes:
     """
     Класс для работы со списком нот.
+
+    Ноты хранятся по столбцам в массивах NumPy: MIDI-номер, начало,
+    длительность (в долях такта) и сила нажатия. Темп записи (tempo)
+    хранится вместе с нотами, None — темп не задан.
     """
-    def __init__(self, notes: List[Note]):
+    def __init__(self, notes: List[Note] = None, tempo: int = None):
         """
         Инициализация списка нот.
 
         :param notes: Список объектов Note.
+        :param tempo: Темп (ударов в минуту).
+        """
+        notes = notes or []
+        self._set_arrays(
+            [note.midi for note in notes],
+            [note.duration for note in notes],
+            [note.velocity for note in notes]
+        )
+        self.tempo = tempo
+
+    def _set_arrays(self, midi, duration, velocity, onset=None):
+        self.midi = np.asarray(midi, dtype=np.int16)
+        self.duration = np.asarray(duration, dtype=np.float64)
+        self.velocity = np.asarray(velocity, dtype=np.uint8)
+        if onset is None:
+            # Ноты идут друг за другом: начало — сумма предыдущих длительностей
+            onset = np.concatenate([[0.0], np.cumsum(self.duration)[:-1]]) if len(self.duration) else np.zeros(0)
+        self.onset = np.asarray(onset, dtype=np.float64)
+
+    @classmethod
+    def from_arrays(cls, midi, duration, velocity, onset=None, tempo: int = None) -> "Notes":
+        """
+        Создание объекта Notes из массивов.
+
+        :param midi: MIDI-номера нот.
+        :param duration: Длительности (в долях такта).
+        :param velocity: Сила нажатия.
+        :param onset: Начало каждой ноты (по умолчанию ноты идут подряд).
+        :param tempo: Темп (ударов в минуту).
+        :return: Объект Notes.
         """
-        self.notes = notes
+        notes = cls.__new__(cls)
+        notes._set_arrays(midi, duration, velocity, onset)
+        notes.tempo = tempo
+        return notes
 
     @classmethod
     def from_json(cls, json_data: Dict) -> "Notes":
@@ -40,8 +192,118 @@ class Notes:
         :param json_data: JSON-объект с массивом нот.
         :return: Объект Notes.
         """
-        notes = [
-            Note(pitch=note["pitch"], duration=note["duration"], velocity=note.get("velocity", 100))
-            for note in json_data["notesArray"]
-        ]
-        return cls(notes)
+        notes_array = json_data["notesArray"]
+        onset = None
+        if notes_array and all("onset" in note for note in notes_array):
+            onset = [note["onset"] for note in notes_array]
+        return cls.from_arrays(
+            [note_to_midi_number(note["pitch"]) for note in notes_array],
+            [note["duration"] for note in notes_array],
+            [note.get("velocity", 100) for note in notes_array],
+            onset,
+            json_data.get("tempo")
+        )
+
+    def to_json(self) -> Dict:
+        """
+        Преобразование в JSON-структуру (тот же формат, что читает from_json).
+
+        :return: JSON-объект с массивом нот.
+        """
+        json_data = {
+            "notesArray": [
+                {"pitch": midi_number_to_note(midi), "duration": duration, "velocity": velocity, "onset": onset}
+                for midi, duration, velocity, onset in zip(
+                    self.midi.tolist(), self.duration.tolist(), self.velocity.tolist(), self.onset.tolist()
+                )
+            ]
+        }
+        if self.tempo is not None:
+            json_data["tempo"] = self.tempo
+        return json_data
+
+    @classmethod
+    def from_records(cls, records: np.ndarray, tempo: int = None) -> "Notes":
+        """
+        Создание объекта Notes из массива записей NOTE_RECORD.
+        Столбцы — представления массива записей, данные не копируются.
+        """
+        return cls.from_arrays(records["midi"], records["duration"], records["velocity"], records["onset"], tempo)
+
+    def to_records(self) -> np.ndarray:
+        """
+        Преобразование в массив записей NOTE_RECORD (двоичный формат).
+        """
+        records = np.zeros(len(self), dtype=NOTE_RECORD)
+        records["onset"] = self.onset
+        records["duration"] = self.duration
+        records["midi"] = self.midi
+        records["velocity"] = self.velocity
+        return records
+
+    def save(self, path: str) -> None:
+        """
+        Сохранение нот в двоичном формате.
+
+        :param path: Путь к файлу.
+        """
+        header = NOTES_HEADER.pack(NOTES_MAGIC, NOTES_VERSION, NOTE_RECORD.itemsize, len(self), self.tempo or 0)
+        with open(path, 'wb') as file:
+            file.write(header.ljust(NOTES_HEADER_SIZE, b"\0"))
+            self.to_records().tofile(file)
+
+    @classmethod
+    def load(cls, path: str) -> "Notes":
+        """
+        Загрузка нот из файла. Формат определяется по содержимому: двоичный файл
+        отображается в память (копия при записи, файл не меняется), иначе читается JSON.
+
+        :param path: Путь к двоичному файлу или JSON.
+        :return: Объект Notes.
+        """
+        with open(path, 'rb') as file:
+            header = file.read(NOTES_HEADER_SIZE)
+        if not header.startswith(NOTES_MAGIC):
+            with open(path, 'r', encoding='utf-8') as file:
+                return cls.from_json(json.load(file))
+
+        _, version, record_size, count, tempo = NOTES_HEADER.unpack_from(header)
+        if version != NOTES_VERSION or record_size != NOTE_RECORD.itemsize:
+            raise ValueError(f"Неподдерживаемый формат нот: версия {version}, запись {record_size} байт")
+        tempo = int(round(tempo)) if tempo > 0 else None
+        if not count:
+            return cls.from_records(np.zeros(0, dtype=NOTE_RECORD), tempo)
+        records = np.memmap(path, dtype=NOTE_RECORD, mode='c', offset=NOTES_HEADER_SIZE, shape=(count,))
+        return cls.from_records(records, tempo)
+
+    def chord_starts(self) -> np.ndarray:
+        """
+        Индексы первых нот каждого события: ноты с одинаковым началом, идущие подряд,
+        образуют аккорд (в одноголосной мелодии каждая нота — отдельное событие).
+        """
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(np.concatenate([[True], np.diff(self.onset) != 0]))
+
+    @property
+    def notes(self) -> List[Note]:
+        """
+        Список нот-представлений (для совместимости с кодом, работающим со списком).
+        """
+        return [Note.view(self, i) for i in range(len(self))]
+
+    def __len__(self) -> int:
+        return len(self.midi)
+
+    def __getitem__(self, index: int) -> Note:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Индекс ноты вне диапазона")
+        return Note.view(self, index)
+
+    def __iter__(self):
+        return (Note.view(self, i) for i in range(len(self)))
+
+    def __repr__(self) -> str:
+        return f"Notes({len(self)} нот)"
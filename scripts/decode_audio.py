@@ -0,0 +1,70 @@
+import subprocess
+import numpy as np
+
+# Для распознавания высоты достаточно моно-сигнала с умеренной частотой дискретизации
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_CHANNELS = 1
+
+
+def decode_audio(file_path: str, sample_rate: int = DEFAULT_SAMPLE_RATE, channels: int = DEFAULT_CHANNELS) -> np.ndarray:
+    """
+    Декодирование аудиофайла любого формата в память с помощью ffmpeg.
+    ffmpeg пишет сырые float32-отсчёты в stdout, временный WAV не создаётся.
+
+    :param file_path: Путь к аудиофайлу (MP3, OGG, WAV и т. д.).
+    :param sample_rate: Частота дискретизации результата (Гц).
+    :param channels: Количество каналов результата.
+    :return: Массив формы (channels, количество отсчётов) типа float32.
+    """
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-i', file_path, '-vn',
+        '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1'
+    ]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Ошибка декодирования {file_path}: {result.stderr.decode(errors='replace')}")
+
+    samples = np.frombuffer(result.stdout, dtype='<f4')
+    samples = samples[:len(samples) - len(samples) % channels]
+    return samples.reshape(-1, channels).T
+
+
+def make_sound(samples: np.ndarray, sample_rate: int, start_time: float = 0.0) -> "parselmouth.Sound":
+    """
+    Создание parselmouth.Sound из отсчётов.
+    parselmouth загружается при первом вызове, а не при импорте модуля.
+
+    :param samples: Отсчёты (массив формы (каналы, отсчёты) или моно-сигнал).
+    :param sample_rate: Частота дискретизации (Гц).
+    :param start_time: Время первого отсчёта (в секундах).
+    :return: Объект parselmouth.Sound.
+    """
+    import parselmouth
+    return parselmouth.Sound(samples, sampling_frequency=sample_rate, start_time=start_time)
+
+
+def as_sound(wav_file) -> "parselmouth.Sound":
+    """
+    Звук для анализа: уже декодированный parselmouth.Sound или WAV-файл, прочитанный parselmouth.
+    parselmouth загружается при первом вызове, а не при импорте модуля.
+
+    :param wav_file: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :return: Объект parselmouth.Sound.
+    """
+    import parselmouth
+    return wav_file if isinstance(wav_file, parselmouth.Sound) else parselmouth.Sound(wav_file)
+
+
+def load_sound(file_path: str, sample_rate: int = DEFAULT_SAMPLE_RATE, channels: int = DEFAULT_CHANNELS) -> "parselmouth.Sound":
+    """
+    Декодирование аудиофайла сразу в parselmouth.Sound.
+
+    :param file_path: Путь к аудиофайлу.
+    :param sample_rate: Частота дискретизации (Гц).
+    :param channels: Количество каналов.
+    :return: Объект parselmouth.Sound.
+    """
+    samples = decode_audio(file_path, sample_rate, channels)
+    if not samples.shape[1]:
+        raise RuntimeError(f"Файл {file_path} не содержит аудио")
+    return make_sound(samples, sample_rate)
@@ -0,0 +1,192 @@
+import numpy as np
+
+# Стандартный строй гитары: MIDI-номера открытых струн от 6-й (самой низкой) до 1-й (E2 A2 D3 G3 B3 E4)
+STANDARD_TUNING = (40, 45, 50, 55, 59, 64)
+
+# Ограничения грифа и растяжки пальцев (в ладах)
+MAX_FRET = 20
+MAX_SPAN = 4
+
+# Веса штрафов аппликатуры
+MOVE_WEIGHT = 1.0    # сдвиг руки вдоль грифа (за лад)
+STRING_WEIGHT = 0.3  # переход между струнами (за струну)
+FRET_WEIGHT = 0.1    # игра в высоких позициях (за лад)
+SPAN_WEIGHT = 0.5    # растяжка пальцев в аккорде (за лад)
+
+# Сколько переходов считается одним блоком массивов
+BLOCK_SIZE = 1024
+
+
+def fretted_position(frets: np.ndarray):
+    """
+    Положение руки и растяжка для каждой постановки. Открытые струны (лад 0)
+    не требуют пальцев и не учитываются.
+
+    :param frets: Лады формы (постановки, ноты).
+    :return: Кортеж (средний прижатый лад или NaN, если все струны открытые; растяжка в ладах).
+    """
+    fretted = frets > 0
+    count = fretted.sum(axis=1)
+    position = np.where(fretted, frets, 0).sum(axis=1) / np.maximum(count, 1)
+    position = np.where(count > 0, position, np.nan)
+    highest = np.where(fretted, frets, np.iinfo(np.int16).min).max(axis=1)
+    lowest = np.where(fretted, frets, np.iinfo(np.int16).max).min(axis=1)
+    span = np.where(count > 0, highest.astype(np.int64) - lowest, 0)
+    return position, span
+
+
+class Fingering:
+    """
+    Выбор струн и ладов для последовательности нот и аккордов.
+
+    Каждое событие (нота или аккорд) имеет набор возможных постановок —
+    назначений нот на разные струны. Динамическое программирование (Витерби)
+    выбирает постановки, минимизирующие сдвиги руки по всей пьесе:
+    O(n · постановок²), все таблицы целочисленные и считаются заранее.
+    """
+    def __init__(self, tuning=STANDARD_TUNING, min_fret: int = 0, max_fret: int = MAX_FRET, max_span: int = MAX_SPAN):
+        """
+        Инициализация.
+
+        :param tuning: MIDI-номера открытых струн от самой низкой к самой высокой.
+        :param min_fret: Минимальный лад (например, при каподастре).
+        :param max_fret: Максимальный лад.
+        :param max_span: Максимальная растяжка пальцев в аккорде (в ладах).
+        """
+        self.tuning = tuple(int(pitch) for pitch in tuning)
+        self.min_fret = min_fret
+        self.max_fret = max_fret
+        self.max_span = max_span
+
+        # Лад каждой ноты на каждой струне (-1, если на этой струне нота не берётся)
+        frets = np.arange(128)[:, None] - np.array(self.tuning)[None, :]
+        self.fret_table = np.where((frets >= min_fret) & (frets <= max_fret), frets, -1).astype(np.int16)
+
+        # Постановки уже встречавшихся аккордов
+        self._voicings = {}
+
+    def string_number(self, string_index: int) -> int:
+        """
+        Номер струны в нотации (1 — самая высокая) по индексу в строе.
+        """
+        return len(self.tuning) - string_index
+
+    def voicings(self, chord):
+        """
+        Все постановки аккорда: каждая нота на своей струне, растяжка не больше max_span.
+
+        :param chord: Кортеж MIDI-номеров нот.
+        :return: Массив индексов струн формы (постановки, ноты) и массив ладов той же формы.
+        """
+        if chord in self._voicings:
+            return self._voicings[chord]
+
+        strings = np.zeros((0, len(chord)), dtype=np.int16)
+        # Нот больше, чем струн, или нота вне MIDI-диапазона: постановок нет
+        playable = len(chord) <= len(self.tuning) and all(0 <= pitch < 128 for pitch in chord)
+        options = [np.flatnonzero(self.fret_table[pitch] >= 0).tolist() for pitch in chord] if playable else []
+
+        # Перебор с возвратом: занятые струны пропускаются, ветви с растяжкой
+        # больше max_span отсекаются сразу (вместо полного декартова произведения)
+        found = []
+        current = []
+
+        def search(index, lowest, highest):
+            if index == len(chord):
+                found.append(tuple(current))
+                return
+            for string_index in options[index]:
+                if string_index in current:
+                    continue
+                fret = int(self.fret_table[chord[index], string_index])
+                low, high = lowest, highest
+                if fret > 0:
+                    low, high = min(low, fret), max(high, fret)
+                    if high - low > self.max_span:
+                        continue
+                current.append(string_index)
+                search(index + 1, low, high)
+                current.pop()
+
+        if playable:
+            search(0, self.max_fret + 1, -1)
+        if found:
+            strings = np.array(found, dtype=np.int16)
+        frets = self.fret_table[np.array(chord)[None, :], strings] if len(strings) else strings.copy()
+
+        self._voicings[chord] = (strings, frets)
+        return strings, frets
+
+    def _state_table(self, chords):
+        """
+        Таблицы состояний всех событий, дополненные до одинакового числа постановок.
+
+        :return: Кортеж (положение руки, средняя струна, собственная стоимость, постановки по событиям).
+                 Событие без постановок получает одно пустое состояние.
+        """
+        unique = {}
+        inverse = np.array([unique.setdefault(chord, len(unique)) for chord in chords], dtype=np.int64)
+        voicings = [self.voicings(chord) for chord in unique]
+        width = max(max((len(strings) for strings, _ in voicings), default=1), 1)
+
+        hand = np.full((len(unique), width), np.nan)
+        string = np.full((len(unique), width), np.nan)
+        static = np.full((len(unique), width), np.inf)
+        for i, (strings, frets) in enumerate(voicings):
+            if not len(strings):
+                # Ноты вне диапазона грифа: пустое состояние без стоимости и без переходов
+                static[i, 0] = 0.0
+                continue
+            position, span = fretted_position(frets)
+            count = len(strings)
+            hand[i, :count] = position
+            string[i, :count] = strings.mean(axis=1)
+            static[i, :count] = FRET_WEIGHT * np.nan_to_num(position) + SPAN_WEIGHT * span
+
+        return hand[inverse], string[inverse], static[inverse], [voicings[i] for i in inverse.tolist()]
+
+    def assign(self, chords):
+        """
+        Выбор постановки для каждого события.
+
+        :param chords: Список кортежей MIDI-номеров (для одиночной ноты — кортеж из одного номера).
+        :return: Для каждого события список пар (номер струны, лад) в порядке нот аккорда
+                 или None, если событие нельзя сыграть в заданном строе.
+        """
+        chords = [tuple(int(pitch) for pitch in chord) for chord in chords]
+        if not chords:
+            return []
+        hand, string, static, voicings = self._state_table(chords)
+        count, width = hand.shape
+
+        # Прямой проход Витерби
+        back = np.zeros((count, width), dtype=np.int32)
+        cost = static[0].copy()
+        columns = np.arange(width)
+        for start in range(1, count, BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, count)
+            # Стоимости переходов для блока: сдвиг руки (открытые струны руку не сдвигают) и смена струн
+            move = np.nan_to_num(np.abs(hand[start - 1:stop - 1, :, None] - hand[start:stop, None, :]))
+            jump = np.nan_to_num(np.abs(string[start - 1:stop - 1, :, None] - string[start:stop, None, :]))
+            transitions = MOVE_WEIGHT * move + STRING_WEIGHT * jump
+            for t in range(start, stop):
+                total = cost[:, None] + transitions[t - start]
+                back[t] = total.argmin(axis=0)
+                cost = total[back[t], columns] + static[t]
+
+        # Обратный проход
+        states = np.zeros(count, dtype=np.int32)
+        states[-1] = cost.argmin()
+        for t in range(count - 1, 0, -1):
+            states[t - 1] = back[t, states[t]]
+
+        result = []
+        for (strings, frets), state in zip(voicings, states.tolist()):
+            if not len(strings):
+                result.append(None)
+                continue
+            result.append([
+                (self.string_number(string_index), fret)
+                for string_index, fret in zip(strings[state].tolist(), frets[state].tolist())
+            ])
+        return result
@@ -0,0 +1,163 @@
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Модули, которые загружаются в процессе-шаблоне один раз: рабочие процессы
+# порождаются от него fork-ом и получают их уже загруженными (страницы памяти
+# общие, копируются только при записи)
+WORKER_PRELOAD = ('numpy', 'parselmouth', 'pipeline')
+
+
+def prewarmed_context(preload=WORKER_PRELOAD):
+    """
+    Контекст multiprocessing для пула рабочих процессов: forkserver с заранее
+    загруженными модулями preload. Новый рабочий процесс запускается за миллисекунды
+    и не импортирует тяжёлые зависимости заново; в отличие от fork, он порождается
+    от однопоточного процесса-шаблона, а не от процесса бота с потоками.
+
+    :param preload: Имена модулей для загрузки в процесс-шаблон.
+    :return: Контекст forkserver или контекст по умолчанию, если forkserver недоступен (Windows).
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(list(preload))
+    return context
+
+
+class QueueFullError(Exception):
+    """
+    Очередь заданий заполнена.
+    """
+
+
+class UserLimitError(Exception):
+    """
+    У пользователя уже слишком много заданий в очереди.
+    """
+
+
+class JobQueue:
+    """
+    Ограниченная очередь заданий поверх пула процессов.
+
+    Задания ждут в очереди и передаются в пул не больше, чем есть рабочих
+    процессов, поэтому позиция в очереди всегда известна, а долгое задание
+    занимает только один процесс.
+    """
+    def __init__(self, workers: int = 2, max_queue: int = 20, per_user_limit: int = 2, preload=WORKER_PRELOAD):
+        """
+        Инициализация очереди.
+
+        :param workers: Количество рабочих процессов.
+        :param max_queue: Максимальное количество ожидающих заданий.
+        :param per_user_limit: Максимальное количество заданий одного пользователя
+                               (ожидающих и выполняющихся).
+        :param preload: Модули, заранее загружаемые для рабочих процессов (см. prewarmed_context).
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=prewarmed_context(preload))
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._user_jobs = {}
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+        # Диспетчеры: каждый держит не больше одного задания в пуле
+        self._dispatchers = [
+            threading.Thread(target=self._dispatch, name=f"job-dispatcher-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for dispatcher in self._dispatchers:
+            dispatcher.start()
+
+    @property
+    def depth(self) -> int:
+        """
+        Количество заданий, ожидающих свободного процесса.
+        """
+        with self._condition:
+            return len(self._queue)
+
+    def stats(self) -> dict:
+        """
+        Текущее состояние очереди.
+        """
+        with self._condition:
+            return {
+                "depth": len(self._queue),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def submit(self, user_id, fn, *args, **kwargs):
+        """
+        Постановка задания в очередь.
+
+        :param user_id: Пользователь, которому принадлежит задание.
+        :param fn: Функция, выполняемая в рабочем процессе (должна сериализоваться pickle).
+        :return: Кортеж (позиция в очереди, Future с результатом функции). Позиция —
+                 сколько заданий займут процессы раньше этого; 0 — задание
+                 выполняется сразу, так как есть свободный процесс.
+        :raises QueueFullError: Если очередь заполнена.
+        :raises UserLimitError: Если превышен лимит заданий пользователя.
+        """
+        future = Future()
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self._rejected += 1
+                raise QueueFullError(f"Очередь заполнена ({self.max_queue})")
+            if self._user_jobs.get(user_id, 0) >= self.per_user_limit:
+                self._rejected += 1
+                raise UserLimitError(f"Превышен лимит заданий пользователя ({self.per_user_limit})")
+
+            self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + 1
+            self._queue.append((user_id, future, fn, args, kwargs))
+            # Свободные процессы разберут первые задания очереди сразу
+            position = max(0, len(self._queue) - (self.workers - self._in_flight))
+            self._condition.notify()
+        return position, future
+
+    def _dispatch(self):
+        """
+        Цикл диспетчера: берёт задание из очереди и ждёт его выполнения в пуле.
+        """
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                user_id, future, fn, args, kwargs = self._queue.popleft()
+                self._in_flight += 1
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = self._executor.submit(fn, *args, **kwargs).result()
+                    except Exception as e:
+                        with self._condition:
+                            self._failed += 1
+                        future.set_exception(e)
+                    else:
+                        with self._condition:
+                            self._completed += 1
+                        future.set_result(result)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._user_jobs[user_id] -= 1
+                    if not self._user_jobs[user_id]:
+                        del self._user_jobs[user_id]
+
+    def shutdown(self):
+        """
+        Остановка пула процессов.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,28 +1,40 @@
 import sys
 import os
-import classes.storage as storage
-
-file_name = storage.load_file_name()
+from classes.job import file_name_from_argv
 
 # Добавляем корневую директорию проекта в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
 
-from classes.notes import Notes
+from classes.notes import Notes, load_notes
 import json
 
 def load_json(file_path: str) -> Notes:
     """
-    Загрузка данных из JSON-файла и преобразование в объект Notes.
+    Загрузка нот из файла и преобразование в объект Notes.
+    Принимает как JSON, так и двоичный формат нот (определяется по содержимому).
 
-    :param file_path: Путь к JSON-файлу.
+    :param file_path: Путь к JSON-файлу или двоичному файлу нот.
     :return: Объект Notes.
     """
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = json.load(file)
-    return Notes.from_json(data)
+    return load_notes(file_path)
+
+
+def save_json(notes: Notes, file_path: str) -> None:
+    """
+    Экспорт нот в JSON (формат notesArray).
+
+    :param notes: Объект Notes.
+    :param file_path: Путь к JSON-файлу.
+    """
+    with open(file_path, "w", encoding="utf-8") as file:
+        json.dump(notes.to_json(), file, indent=4, ensure_ascii=False)
 
 
 if __name__ == "__main__":
-    input_path = f"../data/{file_name}_input.json"
+    file_name = file_name_from_argv()
+    input_path = f"../data/{file_name}_notes.bin"
     notes = load_json(input_path)
     print("Загруженные ноты:", notes.notes)
+
+    # Экспорт в JSON для просмотра
+    save_json(notes, f"../data/{file_name}_input.json")
@@ -0,0 +1,258 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Путь к LilyPond (можно переопределить переменной окружения)
+LILYPOND = os.environ.get('BARDDO_LILYPOND', 'lilypond')
+
+# Команды, которые LilyPond принимает только на верхнем уровне файла (не внутри \book)
+TOP_LEVEL_PATTERN = re.compile(r"^\s*\\(version|language|include)\b")
+
+# Язык названий нот LilyPond по умолчанию
+DEFAULT_LANGUAGE = '\\language "nederlands"'
+
+
+def run_lilypond(ly_path: str, output_base: str, timeout: float = None) -> None:
+    """
+    Запуск LilyPond для одного .ly-файла.
+
+    :param ly_path: Путь к .ly-файлу.
+    :param output_base: Путь к результату без расширения (или папка для \\bookOutputName).
+    :param timeout: Ограничение времени работы (в секундах).
+    :raises RuntimeError: Если LilyPond завершился с ошибкой.
+    """
+    command = [LILYPOND, '-dno-point-and-click', '--loglevel=ERROR', f'--output={output_base}', ly_path]
+    result = subprocess.run(command, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"Ошибка LilyPond для {ly_path}: {result.stderr.decode(errors='replace')}")
+
+
+def render_file(ly_path: str, pdf_path: str, timeout: float = None) -> str:
+    """
+    Отдельный запуск LilyPond для одного документа (без очереди и объединения).
+
+    :param ly_path: Путь к .ly-файлу.
+    :param pdf_path: Путь для сохранения PDF-файла.
+    :return: Путь к PDF-файлу.
+    """
+    run_lilypond(ly_path, os.path.splitext(pdf_path)[0], timeout)
+    if not os.path.exists(pdf_path):
+        raise RuntimeError(f"LilyPond не создал {pdf_path}")
+    return pdf_path
+
+
+def split_document(source: str):
+    """
+    Разделение .ly-документа на команды верхнего уровня (\\version, \\language,
+    \\include) и остальное содержимое, которое можно поместить внутрь \\book.
+
+    :param source: Текст .ly-документа.
+    :return: Кортеж (строка версии или None, список других команд верхнего уровня, тело).
+    """
+    version, top_level, body = None, [], []
+    for line in source.splitlines():
+        match = TOP_LEVEL_PATTERN.match(line)
+        if not match:
+            body.append(line)
+        elif match.group(1) == 'version':
+            version = line.strip()
+        else:
+            top_level.append(line.strip())
+    return version, top_level, "\n".join(body)
+
+
+def build_book_file(sources) -> str:
+    """
+    Объединение нескольких документов в один .ly-файл: каждый документ становится
+    отдельным блоком \\book с собственным именем результата doc<номер>.
+
+    :param sources: Тексты .ly-документов.
+    :return: Текст объединённого .ly-файла.
+    """
+    version, books = None, []
+    for i, source in enumerate(sources):
+        document_version, top_level, body = split_document(source)
+        version = version or document_version
+        # \language действует до следующего \language, поэтому задаётся перед каждой книгой
+        if not any(line.startswith('\\language') for line in top_level):
+            top_level = [DEFAULT_LANGUAGE] + top_level
+        books.append("\n".join(top_level + [f'\\book {{\n\\bookOutputName "doc{i}"\n{body}\n}}']))
+    return "\n".join(([version] if version else []) + books) + "\n"
+
+
+class LilyPondService:
+    """
+    Очередь документов LilyPond с объединением в пакеты.
+
+    Ожидающие документы объединяются в один файл с несколькими блоками \\book
+    и рендерятся одним запуском LilyPond, затем PDF раскладываются по местам.
+    Одновременно работает не больше max_processes процессов LilyPond.
+    """
+    def __init__(self, max_processes: int = 2, max_batch: int = 8, batch_delay: float = 0.05, timeout: float = 300):
+        """
+        Инициализация сервиса.
+
+        :param max_processes: Максимальное количество одновременных процессов LilyPond.
+        :param max_batch: Максимальное количество документов в одном запуске.
+        :param batch_delay: Сколько ждать других документов перед запуском (в секундах).
+        :param timeout: Ограничение времени одного запуска (в секундах).
+        """
+        self.max_processes = max_processes
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._rendered = 0
+        self._failed = 0
+        self._batches = 0
+        self._wait_seconds = 0.0
+        self._render_seconds = 0.0
+        self._last_render_seconds = None
+
+        # Рабочие потоки: каждый держит не больше одного процесса LilyPond
+        self._workers = [
+            threading.Thread(target=self._work, name=f"lilypond-{i}", daemon=True)
+            for i in range(max_processes)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def depth(self) -> int:
+        """
+        Количество документов, ожидающих рендеринга.
+        """
+        with self._condition:
+            return len(self._queue)
+
+    def stats(self) -> dict:
+        """
+        Текущее состояние очереди и время рендеринга.
+        """
+        with self._condition:
+            finished = self._rendered + self._failed
+            return {
+                "depth": len(self._queue),
+                "in_flight": self._in_flight,
+                "rendered": self._rendered,
+                "failed": self._failed,
+                "batches": self._batches,
+                "average_batch": finished / self._batches if self._batches else None,
+                "average_wait_seconds": self._wait_seconds / finished if finished else None,
+                "render_seconds": self._render_seconds,
+                "average_render_seconds": self._render_seconds / finished if finished else None,
+                "last_render_seconds": self._last_render_seconds,
+            }
+
+    def submit(self, ly_path: str, pdf_path: str) -> Future:
+        """
+        Постановка документа в очередь рендеринга.
+
+        :param ly_path: Путь к .ly-файлу.
+        :param pdf_path: Путь для сохранения PDF-файла.
+        :return: Future с путём к PDF-файлу.
+        """
+        future = Future()
+        with self._condition:
+            self._queue.append((ly_path, pdf_path, future, time.perf_counter()))
+            self._condition.notify()
+        return future
+
+    def _work(self):
+        """
+        Цикл рабочего потока: собирает пакет документов и рендерит его.
+        """
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                # Небольшая пауза, чтобы в пакет попали документы, пришедшие следом
+                if len(self._queue) < self.max_batch and self.batch_delay:
+                    self._condition.wait(self.batch_delay)
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                if not batch:
+                    continue
+                self._in_flight += 1
+                started = time.perf_counter()
+                self._wait_seconds += sum(started - queued for _, _, _, queued in batch)
+
+            try:
+                results = self._render_batch([(ly_path, pdf_path) for ly_path, pdf_path, _, _ in batch])
+            finally:
+                seconds = time.perf_counter() - started
+                with self._condition:
+                    self._in_flight -= 1
+                    self._batches += 1
+                    self._render_seconds += seconds
+                    self._last_render_seconds = seconds / len(batch)
+
+            for (_, pdf_path, future, _), error in zip(batch, results):
+                with self._condition:
+                    if error is None:
+                        self._rendered += 1
+                    else:
+                        self._failed += 1
+                if future.set_running_or_notify_cancel():
+                    if error is None:
+                        future.set_result(pdf_path)
+                    else:
+                        future.set_exception(error)
+
+    def _render_batch(self, documents):
+        """
+        Рендеринг пакета одним запуском LilyPond. Если общий запуск не удался,
+        документы рендерятся по одному, чтобы ошибка одного не затронула остальные.
+
+        :param documents: Список пар (путь к .ly, путь к PDF).
+        :return: Список ошибок (None для успешно созданных PDF).
+        """
+        if len(documents) == 1:
+            return [self._render_single(*documents[0])]
+
+        folder = tempfile.mkdtemp(prefix='barddo_lilypond_')
+        try:
+            sources = []
+            for ly_path, _ in documents:
+                with open(ly_path, 'r', encoding='utf-8') as file:
+                    sources.append(file.read())
+            book_path = os.path.join(folder, 'batch.ly')
+            with open(book_path, 'w', encoding='utf-8') as file:
+                file.write(build_book_file(sources))
+            run_lilypond(book_path, folder + os.sep, self.timeout)
+
+            for i, (_, pdf_path) in enumerate(documents):
+                shutil.move(os.path.join(folder, f"doc{i}.pdf"), pdf_path)
+            return [None] * len(documents)
+        except Exception as e:
+            print(f"Общий запуск LilyPond не удался ({len(documents)} документов), рендеринг по одному: {e}")
+            return [self._render_single(ly_path, pdf_path) for ly_path, pdf_path in documents]
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _render_single(self, ly_path: str, pdf_path: str):
+        """
+        Рендеринг одного документа. Возвращает ошибку или None.
+        """
+        try:
+            render_file(ly_path, pdf_path, self.timeout)
+        except Exception as e:
+            return e
+        return None
+
+    def shutdown(self):
+        """
+        Отмена документов, ещё не переданных LilyPond.
+        """
+        with self._condition:
+            while self._queue:
+                _, _, future, _ = self._queue.popleft()
+                future.cancel()
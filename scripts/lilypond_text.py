@@ -0,0 +1,41 @@
+# Общие таблицы для генерации кода LilyPond (ноты и табулатуры)
+import os
+
+# Версия LilyPond, под которую генерируется код
+LILYPOND_VERSION = "2.24.2"
+
+# Названия нот LilyPond (голландские, язык по умолчанию) для каждой ноты октавы
+LILYPOND_NOTE_NAMES = ['c', 'cis', 'd', 'dis', 'e', 'f', 'fis', 'g', 'gis', 'a', 'ais', 'b']
+
+def midi_to_lilypond(midi_number):
+    """
+    Преобразует MIDI-номер в формат LilyPond (c = C3, c' = C4, c, = C2).
+    """
+    octave = midi_number // 12 - 1
+    lilypond_octave = "'" * (octave - 3) if octave >= 3 else "," * (3 - octave)
+    return LILYPOND_NOTE_NAMES[midi_number % 12] + lilypond_octave
+
+# Готовая таблица для всех MIDI-номеров
+LILYPOND_PITCHES = [midi_to_lilypond(midi_number) for midi_number in range(128)]
+
+# Длительность LilyPond, которой записывается одна доля нот (длительность 1.0):
+# в нотах и табулатурах 1.0 — целая нота, а в MIDI 1.0 — одна доля темпа
+BEAT_DURATION = "1"
+
+def tempo_mark(tempo):
+    """
+    Обозначение темпа LilyPond (например, "\\tempo 1 = 96"); пустая строка, если темп не задан.
+    Темп указывается для записанной длительности доли (BEAT_DURATION), поэтому
+    ноты в PDF звучат с той же скоростью, что в MIDI и в записи.
+    """
+    return f"\\tempo {BEAT_DURATION} = {int(tempo)}\n" if tempo else ""
+
+def write_text_atomic(path, text):
+    """
+    Запись .ly-файла через временный файл: LilyPond, читающий файл в это время,
+    видит либо старое, либо новое содержимое целиком.
+    """
+    temp_path = f"{path}.{os.getpid()}.part"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(temp_path, path)
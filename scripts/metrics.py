@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Границы корзин гистограмм длительностей (в секундах)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class StageTimer:
+    """
+    Время этапов и события (например, попадания в кэш) одного задания.
+
+    Таймер создаётся в рабочем процессе, а его словари возвращаются
+    родительскому процессу вместе с результатом задания.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.events = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Замер времени этапа (время повторяющихся этапов складывается).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def event(self, name: str) -> None:
+        """
+        Учёт события (например, 'contours_hit').
+        """
+        self.events[name] = self.events.get(name, 0) + 1
+
+
+def timed(timer: StageTimer, name: str):
+    """
+    Замер этапа, если таймер задан (иначе пустой контекст).
+    """
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+def format_labels(labels: dict) -> str:
+    """
+    Метки в формате Prometheus: {name="value",...}.
+    """
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Реестр метрик в текстовом формате Prometheus: счётчики, гистограммы
+    длительностей и показатели (gauge), значения которых читаются при запросе.
+
+    Метрики объявляются один раз (counter, histogram, gauge), затем обновляются
+    из цикла событий бота; HTTP-сервер читает их из своего потока.
+    """
+    def __init__(self, prefix: str = "barddo"):
+        """
+        :param prefix: Префикс имён метрик.
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._kinds = {}
+        self._help = {}
+        self._values = {}
+        self._gauges = {}
+
+    def _declare(self, name: str, kind: str, help_text: str) -> None:
+        self._kinds[name] = kind
+        self._help[name] = help_text
+        self._values.setdefault(name, {})
+
+    def counter(self, name: str, help_text: str) -> None:
+        """
+        Объявление счётчика.
+        """
+        self._declare(name, "counter", help_text)
+
+    def histogram(self, name: str, help_text: str) -> None:
+        """
+        Объявление гистограммы длительностей (корзины DURATION_BUCKETS).
+        """
+        self._declare(name, "histogram", help_text)
+
+    def gauge(self, name: str, help_text: str, fn, **labels) -> None:
+        """
+        Объявление показателя: fn вызывается при каждом запросе метрик.
+        Один показатель может иметь несколько наборов меток (по вызову на набор).
+        """
+        self._kinds[name] = "gauge"
+        self._help[name] = help_text
+        self._gauges.setdefault(name, []).append((labels, fn))
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        """
+        Увеличение счётчика.
+        """
+        key = tuple(labels.items())
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Добавление значения в гистограмму.
+        """
+        key = tuple(labels.items())
+        with self._lock:
+            values = self._values[name]
+            if key not in values:
+                values[key] = [0] * len(DURATION_BUCKETS) + [0.0, 0]
+            state = values[key]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def observe_timer(self, name: str, timer: StageTimer, **labels) -> None:
+        """
+        Добавление времени всех этапов таймера в гистограмму (метка stage).
+        """
+        for stage, seconds in timer.timings.items():
+            self.observe(name, seconds, stage=stage, **labels)
+
+    def render(self) -> str:
+        """
+        Текст всех метрик в формате Prometheus.
+        """
+        lines = []
+        with self._lock:
+            for name, kind in self._kinds.items():
+                full_name = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                if kind == "gauge":
+                    for labels, fn in self._gauges[name]:
+                        lines.append(f"{full_name}{format_labels(labels)} {fn()}")
+                elif kind == "counter":
+                    for key, value in self._values[name].items():
+                        lines.append(f"{full_name}{format_labels(dict(key))} {value}")
+                else:
+                    for key, state in self._values[name].items():
+                        labels = dict(key)
+                        for bound, count in zip(DURATION_BUCKETS + ("+Inf",), state[:-2] + [state[-1]]):
+                            lines.append(f"{full_name}_bucket{format_labels({**labels, 'le': bound})} {count}")
+                        lines.append(f"{full_name}_sum{format_labels(labels)} {state[-2]}")
+                        lines.append(f"{full_name}_count{format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def start_http_server(metrics: Metrics, port: int, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """
+    Запуск HTTP-сервера метрик (GET /metrics) в фоновом потоке.
+
+    :param metrics: Реестр метрик.
+    :param port: Порт.
+    :param host: Адрес (по умолчанию только локальный).
+    :return: Запущенный сервер (server.shutdown() — остановка).
+    """
+    # http.server нужен только боту, рабочие процессы его не загружают
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Запросы метрик не пишутся в лог
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def log_json(record: dict) -> None:
+    """
+    Печать записи одной строкой JSON (для сбора логов).
+    """
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
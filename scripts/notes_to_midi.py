@@ -1,41 +1,164 @@
 import sys
 import os
-from mido import Message, MidiFile, MidiTrack, MetaMessage
-import classes.storage as storage
-
-file_name = storage.load_file_name()
+import struct
+from typing import List
+import numpy as np
 
 # Добавляем путь к папке scripts для импорта классов
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
 
-from classes.notes import Notes, Note
+from classes.job import file_name_from_argv
+from classes.notes import Notes, DEFAULT_TEMPO
+import classes.notes as notes_module
+
+# Количество тиков на четверть
+TICKS_PER_BEAT = 480
+
+# Байты статуса MIDI-событий
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
 
+# Конец трека: дельта 0, мета-событие FF 2F 00
+END_OF_TRACK = b"\x00\xff\x2f\x00"
 
-def notes_to_midi(notes: Notes, output_path: str) -> None:
+
+def notes_to_midi(notes: Notes, output_path: str, tempo: int = None) -> None:
     """
     Преобразование объекта Notes в MIDI-файл.
 
     :param notes: Объект Notes, содержащий список нот.
     :param output_path: Путь для сохранения MIDI-файла.
+    :param tempo: Темп (ударов в минуту); по умолчанию темп нот (или DEFAULT_TEMPO).
     """
-    midi = MidiFile()  # Создаем MIDI-файл
-    track = MidiTrack()  # Создаем трек
-    midi.tracks.append(track)  # Добавляем трек в MIDI-файл
+    tempo = tempo or notes.tempo or DEFAULT_TEMPO
+    # Один трек: темп и ноты (как MidiFile() с одним MidiTrack в mido)
+    with open(output_path, 'wb') as file:
+        file.write(midi_header(1))
+        file.write(track_chunk(tempo_event(tempo) + track_events(notes)))
 
-    # Выбираем темп
-    tempo_microseconds_per_beat = 60000000 // 120
-    track.append(MetaMessage('set_tempo', tempo=tempo_microseconds_per_beat))
 
-    # Переводим каждую ноту в MIDI-сообщение
-    for note in notes.notes:
-        # Преобразуем тон ноты в MIDI-число
-        midi_note = note_to_midi_number(note.pitch)
-        # Добавляем MIDI-сообщения: нота зажата и отпущена
-        track.append(Message('note_on', note=midi_note, velocity=note.velocity, time=0))
-        track.append(Message('note_off', note=midi_note, velocity=note.velocity, time=int(note.duration * 480)))
+def merge_to_midi(notes_list: List[Notes], output_path: str, tempo: int = None, names: List[str] = None) -> None:
+    """
+    Объединение нескольких распознанных мелодий в один многотрековый MIDI-файл
+    (формат 1: трек 0 — темп, далее по треку на каждую мелодию).
+    Треки пишутся в файл по одному, за один проход.
 
-    # Сохраняем MIDI-файл
-    midi.save(output_path)
+    В формате 1 темп общий для всех треков, а доли каждой мелодии отсчитаны
+    в её собственном темпе, поэтому время нот пересчитывается в общий темп:
+    ноты звучат в те же секунды, что и в исходной записи.
+
+    :param notes_list: Список объектов Notes.
+    :param output_path: Путь для сохранения MIDI-файла.
+    :param tempo: Общий темп файла (ударов в минуту); по умолчанию темп первой мелодии (или DEFAULT_TEMPO).
+    :param names: Названия треков (например, имена исходных файлов).
+    """
+    tempo = tempo or (notes_list[0].tempo if notes_list else None) or DEFAULT_TEMPO
+    with open(output_path, 'wb') as file:
+        file.write(midi_header(len(notes_list) + 1))
+        file.write(track_chunk(tempo_event(tempo)))
+        for i, notes in enumerate(notes_list):
+            name = track_name_event(names[i]) if names else b""
+            # Доля мелодии длится 60 / notes.tempo секунд, доля файла — 60 / tempo
+            time_scale = tempo / notes.tempo if notes.tempo else 1.0
+            file.write(track_chunk(name + track_events(notes, time_scale=time_scale)))
+
+
+def midi_header(track_count: int) -> bytes:
+    """
+    Заголовок MIDI-файла (MThd): формат 1, количество треков, тиков на четверть.
+    """
+    return b"MThd" + struct.pack(">IHHH", 6, 1, track_count, TICKS_PER_BEAT)
+
+
+def track_chunk(events: bytes) -> bytes:
+    """
+    Трек MIDI-файла (MTrk) из готовых событий с добавлением конца трека.
+    """
+    return b"MTrk" + struct.pack(">I", len(events) + len(END_OF_TRACK)) + events + END_OF_TRACK
+
+
+def tempo_event(tempo: int) -> bytes:
+    """
+    Мета-событие set_tempo (FF 51 03) с дельтой 0.
+    """
+    tempo_microseconds_per_beat = 60000000 // tempo
+    return b"\x00\xff\x51\x03" + tempo_microseconds_per_beat.to_bytes(3, 'big')
+
+
+def track_name_event(name: str) -> bytes:
+    """
+    Мета-событие track_name (FF 03) с дельтой 0.
+    """
+    # Обрезка до 127 байт без разрыва многобайтового символа UTF-8
+    data = name.encode('utf-8')[:127].decode('utf-8', 'ignore').encode('utf-8')
+    return b"\x00\xff\x03" + bytes([len(data)]) + data
+
+
+def encode_variable_length(values: np.ndarray):
+    """
+    Кодирование массива чисел в формат переменной длины MIDI (по 7 бит в байте).
+
+    :param values: Неотрицательные числа (меньше 2^28).
+    :return: Кортеж (байты каждого числа по 4 на строку, длина кода каждого числа).
+    """
+    values = np.asarray(values, dtype=np.int64)
+    lengths = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+    codes = np.zeros((len(values), 4), dtype=np.uint8)
+    for k in range(4):
+        # k-й байт кода: старшие группы по 7 бит идут первыми, у всех байтов кроме последнего стоит бит 0x80
+        shift = 7 * np.maximum(lengths - 1 - k, 0)
+        byte = (values >> shift) & 0x7F
+        codes[:, k] = np.where(k < lengths - 1, byte | 0x80, byte)
+    return codes, lengths
+
+
+def track_events(notes: Notes, channel: int = 0, time_scale: float = 1.0) -> bytes:
+    """
+    События нот трека одним буфером байтов (без создания объекта на каждое сообщение).
+
+    Время событий считается от начала каждой ноты (onset), поэтому ошибка
+    округления длительностей не накапливается, а одновременные ноты (аккорды)
+    звучат вместе.
+
+    :param notes: Объект Notes.
+    :param channel: MIDI-канал (0–15).
+    :param time_scale: Множитель времени (пересчёт долей из темпа нот в темп файла).
+    :return: Байты событий note_on/note_off с дельта-временем.
+    """
+    count = len(notes)
+    if not count:
+        return b""
+
+    ticks_per_beat = TICKS_PER_BEAT * time_scale
+    on_ticks = np.rint(notes.onset * ticks_per_beat).astype(np.int64)
+    off_ticks = on_ticks + (notes.duration * ticks_per_beat).astype(np.int64)
+    # Очень короткая нота (или сжатая пересчётом темпа) длится хотя бы один тик,
+    # иначе её note_off при сортировке оказался бы перед note_on
+    off_ticks = np.maximum(off_ticks, on_ticks + 1)
+
+    # Все события: сначала note_on, затем note_off; при равном времени note_off идёт первым
+    ticks = np.concatenate([on_ticks, off_ticks])
+    is_off = np.concatenate([np.zeros(count, dtype=bool), np.ones(count, dtype=bool)])
+    order = np.lexsort((~is_off, ticks))
+    ticks, is_off = ticks[order], is_off[order]
+    pitches = np.concatenate([notes.midi, notes.midi])[order].astype(np.uint8)
+    velocities = np.concatenate([notes.velocity, notes.velocity])[order].astype(np.uint8)
+
+    deltas = np.diff(ticks, prepend=0)
+    codes, lengths = encode_variable_length(deltas)
+
+    # Каждое событие: дельта (1–4 байта), статус, нота, сила нажатия
+    sizes = lengths + 3
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    buffer = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(4):
+        used = lengths > k
+        buffer[starts[used] + k] = codes[used, k]
+    status = np.where(is_off, NOTE_OFF, NOTE_ON) | (channel & 0x0F)
+    buffer[starts + lengths] = status
+    buffer[starts + lengths + 1] = pitches
+    buffer[starts + lengths + 2] = velocities
+    return buffer.tobytes()
 
 
 def note_to_midi_number(note: str) -> int:
@@ -45,22 +168,15 @@ def note_to_midi_number(note: str) -> int:
     :param note: Тон ноты (например, "C4").
     :return: MIDI-номер.
     """
-    # Таблица для преобразования нот
-    note_base = {"C": 0, "C#": 1, "D": 2, "D#": 3, "E": 4, "F": 5, "F#": 6, "G": 7, "G#": 8, "A": 9, "A#": 10, "B": 11}
-    octave = int(note[-1])  # Извлекаем октаву
-    pitch = note[:-1]  # Извлекаем тон (без октавы)
-
-    # Рассчитываем MIDI-номер
-    midi_number = 12 * (octave + 1) + note_base[pitch]
-
-    return midi_number
+    return notes_module.note_to_midi_number(note)
 
 
 if __name__ == "__main__":
-    input_path = f"../data/{file_name}_input.json"  # Путь к JSON-файлу
+    file_name = file_name_from_argv()
+    input_path = f"../data/{file_name}_notes.bin"  # Путь к файлу нот (двоичный формат или JSON)
     output_path = f"../output/{file_name}_MIDI.mid"  # Путь для сохранения MIDI-файла
 
-    # Загружаем JSON и преобразуем в Notes
+    # Загружаем ноты (формат определяется автоматически)
     from json_to_notes import load_json
     notes = load_json(input_path)
 
@@ -1,8 +1,57 @@
-import abjad
-from classes.notes import Notes, Note
-import classes.storage as storage
+import numpy as np
+from classes.notes import Notes
+from classes.job import file_name_from_argv
+from lilypond_service import render_file
+from lilypond_text import LILYPOND_VERSION, midi_to_lilypond, tempo_mark, write_text_atomic
+
+# Длина такта 4/4 в шестьдесят четвёртых
+BAR_LENGTH = 64
+
+# Длительность ноты -> (длительность LilyPond, длина в шестьдесят четвёртых)
+SHEET_DURATIONS = {1.0: ("1", 64), 0.5: ("2", 32), 0.25: ("4", 16), 0.125: ("8", 8)}
+DEFAULT_SHEET_DURATION = ("1", 64)  # по умолчанию целая нота
+
+
+def written_midi(midi_number: int) -> int:
+    """
+    Высота, которой нота записывается на нотном стане: октавы ниже третьей
+    поднимаются на октаву, октавы выше четвёртой опускаются на октаву.
+
+    :param midi_number: MIDI-номер ноты.
+    :return: MIDI-номер записываемой ноты.
+    """
+    octave = midi_number // 12 - 1
+    if octave < 3:
+        return midi_number + 12
+    if octave >= 5:
+        return midi_number - 12
+    return midi_number
+
+
+# Готовая таблица записи нот на стане для всех MIDI-номеров
+SHEET_PITCHES = np.array([midi_to_lilypond(written_midi(midi_number)) for midi_number in range(128)], dtype=object)
+
+# Шапка и окончание .ly-файла
+SHEET_HEADER = r"""\version "%s"
+\paper {
+  #(set-paper-size "a4")
+  print-page-number = ##t
+  print-first-page-number = ##t
+}
+\score {
+  \new Staff {
+    \new Voice \with {
+      \remove "Note_heads_engraver"
+      \consists "Completion_heads_engraver"
+    } {
+      \time 4/4
+""" % LILYPOND_VERSION
+SHEET_FOOTER = r"""    }
+  }
+  \layout { }
+}
+"""
 
-file_name = storage.load_file_name()
 
 def notes_to_sheet_music(notes: Notes, output_path: str) -> None:
     """
@@ -11,98 +60,80 @@ def notes_to_sheet_music(notes: Notes, output_path: str) -> None:
     :param notes: Объект Notes, содержащий список нот.
     :param output_path: Путь для сохранения PDF-файла.
     """
-    # Создаём систему нот
-    staff = abjad.Staff()
-    score = abjad.Score([staff])
-
-    # Конвертируем каждую ноту в формат Abjad
-    for note in notes.notes:
-        abjad_note = note_to_abjad(note)
-        staff.append(abjad_note)
+    ly_file_path = write_sheet_music_source(notes, output_path)
 
     # Сохраняем результат в PDF
-    abjad.persist.as_pdf(score, output_path)
+    render_file(ly_file_path, output_path)
     print(f"Нотный лист успешно сохранён: {output_path}")
 
 
-def adjust_octave(pitch: str, octave: int) -> int:
-    """
-    Ограничиваем диапазон октав для каждой ноты, в зависимости от ноты и её диапазона.
+def generate_sheet_music_code(notes: Notes, bars_per_line: int = 4, lines_per_page: int = 10) -> str:
     """
-    valid_octaves = {"C": [3, 6], "C#": [3, 6], "D": [3, 6], "D#": [3, 6], "E": [2, 6],
-                     "F": [2, 5], "F#": [2, 5], "G": [2, 5], "G#": [2, 5], "A": [2, 5], "A#": [2, 5], "B": [2, 5]}
-
-    min_octave, max_octave = valid_octaves.get(pitch, [None, None])
-
-    if min_octave is not None and max_octave is not None:
-        # Если текущая октава меньше минимальной, устанавливаем минимальную
-        if octave < min_octave:
-            return min_octave
-        # Если текущая октава больше максимальной, устанавливаем максимальную
-        elif octave > max_octave:
-            return max_octave
-        # Если октава в пределах диапазона, оставляем её без изменений
-        else:
-            return octave
-    else:
-        return octave
-
-
-def note_to_abjad(note: Note) -> abjad.Note:
-    """
-    Преобразует объект Note в ноту Abjad.
+    Генерация кода нотного листа для LilyPond напрямую из массивов нот.
+
+    Ноты с общим началом записываются аккордом <...> с длительностью самой короткой из них.
+    Если у нот задан темп, в начале ставится обозначение темпа.
+    Ноты, пересекающие тактовую черту, LilyPond делит на залигованные части сам
+    (Completion_heads_engraver). После каждого такта ставится проверка такта,
+    после bars_per_line тактов — перенос строки, после lines_per_page строк — новая страница.
 
-    :param note: Нота из класса Note.
-    :return: Нота Abjad.
+    :param notes: Объект Notes, содержащий список нот.
+    :param bars_per_line: Тактов в строке.
+    :param lines_per_page: Строк на странице.
+    :return: Текст .ly-файла.
     """
-    pitch = note.pitch.lower().replace("#", "s")  # Пример: C# -> cs
-    
-    # Получаем октаву из ноты
-    if note.pitch[-1].isdigit():
-        octave = int(note.pitch[-1])  # Если октава указана явно (например, g2)
-        pitch = pitch[:-1]  # Убираем цифру из названия ноты
-    else:
-        octave = 4  # Если октава не указана явно, устанавливаем 4 по умолчанию
-
-    # Ограничиваем диапазон по октаве
-    octave = adjust_octave(pitch, octave)
-
-    # Теперь создаем строку с нотой и октавой, например: f4, c5, g3
-    abjad_pitch = "";
-    if (octave>3 and octave<5):
-        abjad_pitch = f"{pitch}{octave}"
-    elif (octave < 3):
-        abjad_pitch = f"{pitch}{octave+1}"
-    elif (octave >= 5):
-        abjad_pitch = f"{pitch}{octave-1}"
-
-    # Преобразуем длительность ноты в формат Abjad
-    duration = note_duration_to_abjad(note.duration)
-
-    # Убираем апострофы и запятые, если они были добавлены автоматически
-    abjad_note = abjad.Note(abjad_pitch, duration)
-    return abjad_note
-
-
-def note_duration_to_abjad(duration: float) -> abjad.Duration:
+    header = SHEET_HEADER + ("      " + tempo_mark(notes.tempo) if notes.tempo else "")
+    if not len(notes):
+        return header + SHEET_FOOTER
+
+    starts = notes.chord_starts()
+    pitches = SHEET_PITCHES[notes.midi]
+    sizes = np.diff(np.append(starts, len(notes)))
+    if (sizes > 1).any():
+        chords = np.array([s.rstrip() for s in np.add.reduceat(pitches + " ", starts).tolist()], dtype=object)
+        pitches = np.where(sizes > 1, "<" + chords + ">", pitches[starts])
+
+    # Длительности ищутся в таблице один раз для каждого различного значения
+    unique, inverse = np.unique(np.minimum.reduceat(notes.duration, starts), return_inverse=True)
+    lookup = [SHEET_DURATIONS.get(duration, DEFAULT_SHEET_DURATION) for duration in unique.tolist()]
+    durations = np.array([token for token, _ in lookup], dtype=object)[inverse]
+    lengths = np.array([length for _, length in lookup])[inverse]
+
+    # Конец каждой ноты в шестьдесят четвёртых: по нему находятся концы тактов, строк и страниц
+    ends = np.cumsum(lengths)
+    bars = ends // BAR_LENGTH
+    bar_ends = ends % BAR_LENGTH == 0
+    line_ends = bar_ends & (bars % bars_per_line == 0)
+    page_ends = line_ends & (bars % (bars_per_line * lines_per_page) == 0)
+
+    separators = np.full(len(starts), " ", dtype=object)
+    separators[bar_ends] = " |\n"
+    separators[line_ends] = " | \\break\n"
+    separators[page_ends] = " | \\pageBreak\n"
+    separators[-1] = " |\n" if bar_ends[-1] else "\n"
+
+    return header + "".join((pitches + durations + separators).tolist()) + SHEET_FOOTER
+
+
+def write_sheet_music_source(notes: Notes, output_path: str) -> str:
     """
-    Преобразование длительности в формат Abjad.
+    Сохранение кода нотного листа в .ly-файл рядом с будущим PDF.
 
-    :param duration: Длительность в долях такта (например, 0.25 для четвертной).
-    :return: Длительность в формате Abjad.
+    :return: Путь к .ly-файлу.
     """
-    base_durations = {1.0: (1, 1), 0.5: (1, 2), 0.25: (1, 4), 0.125: (1, 8)}
-    numerator, denominator = base_durations.get(duration, (1, 1))
-    return abjad.Duration(numerator, denominator)
+    ly_file_path = output_path.replace(".pdf", ".ly")
+    write_text_atomic(ly_file_path, generate_sheet_music_code(notes))
+    return ly_file_path
 
 
 if __name__ == "__main__":
-    input_path = f"../data/{file_name}_input.json"  # Путь к JSON-файлу
-    output_path = f"../output/{file_name}_NOTES.pdf"  # Путь для сохранения 
+    file_name = file_name_from_argv()
+    input_path = f"../data/{file_name}_notes.bin"  # Путь к файлу нот (двоичный формат или JSON)
+    output_path = f"../output/{file_name}_NOTES.pdf"  # Путь для сохранения
 
     from json_to_notes import load_json
 
-    # Загружаем JSON и преобразуем в Notes
+    # Загружаем ноты (формат определяется автоматически)
     notes = load_json(input_path)
 
     # Генерируем нотный лист
@@ -1,9 +1,9 @@
-import json
-import abjad
-from classes.notes import Notes, Note
-import classes.storage as storage
-
-file_name = storage.load_file_name()
+import numpy as np
+from classes.notes import load_notes, note_to_midi_number
+from classes.job import file_name_from_argv
+from lilypond_service import render_file
+from lilypond_text import LILYPOND_PITCHES, LILYPOND_VERSION, tempo_mark, write_text_atomic
+from fingering import Fingering
 
 def note_duration_to_lilypond(duration):
     """
@@ -24,112 +24,74 @@ def pitch_to_lilypond(pitch):
     """
     Преобразует питч в формат LilyPond.
     """
-    # Разделяем ноту и октаву
-    note, octave = pitch[:-1], int(pitch[-1])
-
-    # Преобразуем ноты: заменяем '#' на 'is' для повышения
-    if note[-1] == '#':
-        lilypond_note = note[:-1].lower() + "s"  # 'F#' -> 'fis'
-    elif note.lower() == 'b':
-        lilypond_note = 'b'  # 'B' не меняем
-    else:
-        lilypond_note = note.lower()
-
-    # Обработка октавы
-    lilypond_octave = "'" * (octave - 3) if octave >= 2 else "," * (3 - octave)
+    return LILYPOND_PITCHES[note_to_midi_number(pitch)]
 
-    return lilypond_note + lilypond_octave
-
-def select_fret_and_string(pitches, simultaneous_play=False):
-    """
-    Возвращает соответствующие струны и лады для заданных питчей.
-    :param pitches: Список питчей (например, ["E4", "G3", "B3"]).
-    :param simultaneous_play: Флаг, который указывает, играются ли ноты одновременно.
-    :return: Список кортежей (струна, лад) для каждого питча.
-    """
-    # Стандартное строение гитары (открытые струны)
-    guitar_tuning = ["E2", "A2", "D3", "G3", "B3", "E4"]  # от самой низкой (6-я струна) к самой высокой (1-я струна)
-    string_pitches = [abjad.NamedPitch(p) for p in guitar_tuning]
-
-    selected_strings_and_frets = []
-    used_strings = set()  # Множество для отслеживания использованных струн
-
-    # Для каждого питча
-    for pitch in pitches:
-        target_pitch = abjad.NamedPitch(pitch)
-        best_string, min_fret = None, None
-
-        # Для каждой струны гитары (с самой низкой до самой высокой)
-        for i, string_pitch in enumerate(string_pitches):
-            # Расстояние между целевой нотой и открытым звуком струны
-            fret = int(target_pitch.midi_number) - int(string_pitch.midi_number)
-
-            # Если лад возможен (больше или равен 0) и струна ещё не использована
-            if fret >= 0 and (best_string is None or fret < min_fret):
-                # Если играются одновременно, ищем разные струны для каждой ноты
-                if simultaneous_play:
-                    if i + 1 not in used_strings:  # Проверяем, не использована ли эта струна
-                        best_string, min_fret = i + 1, fret
-                        used_strings.add(i + 1)  # Отметим струну как использованную
-                        break
-                else:
-                    best_string, min_fret = i + 1, fret
-                    used_strings.add(i + 1)  # Добавляем струну в использованные
-                    break
-
-        # Добавляем в итоговый список выбранную струну и лад
-        selected_strings_and_frets.append((best_string, min_fret))
-
-    return selected_strings_and_frets
-
-def generate_lilypond_tab_code(notes):
+def generate_lilypond_tab_code(notes, fingering=None):
     """
     Генерация кода табулатуры для LilyPond.
+    Струна каждой ноты выбирается заранее (Fingering) и указывается явно (\\N).
+    Ноты с общим началом записываются одним аккордом с длительностью самой короткой из них.
+    Если у нот задан темп, в начале ставится обозначение темпа.
+    :param notes: Объект Notes.
+    :param fingering: Настройки аппликатуры (строй, лады); по умолчанию стандартный строй.
     """
+    fingering = fingering or Fingering()
+    tuning = " ".join(LILYPOND_PITCHES[pitch] for pitch in fingering.tuning)
     header = r"""
-    \version "2.24.2"
+    \version "%s"
     \paper { #(set-paper-size "a4") }
     \score { <<
-    \new TabStaff {
-    """
+    \new TabStaff \with { stringTunings = \stringTuning <%s> } {
+    """ % (LILYPOND_VERSION, tuning) + tempo_mark(notes.tempo)
     footer = r"""
         }
         >>
         \layout { }
     }
     """
+    midi = notes.midi.tolist()
+    starts = notes.chord_starts()
+    bounds = starts.tolist() + [len(midi)]
+    chords = [tuple(midi[start:end]) for start, end in zip(bounds, bounds[1:])]
+    durations = np.minimum.reduceat(notes.duration, starts).tolist() if len(midi) else []
+    positions = fingering.assign(chords)
     notes_lilypond = " ".join(
-        [f"<{pitch_to_lilypond(note.pitch)}>{note_duration_to_lilypond(note.duration)}\n"
-         for note in notes.notes]  # Доступ к списку нот через notes.notes
+        [f"{tab_chord(chord, position)}{note_duration_to_lilypond(duration)}\n"
+         for chord, position, duration in zip(chords, positions, durations)]
     )
     return header + notes_lilypond + footer
 
-def notes_to_tabs(notes, output_path):
+def tab_chord(chord, position):
     """
-    Генерация табулатуры в формате PDF.
+    Аккорд LilyPond с указанием струны каждой ноты (например, "<e\\6 b\\5>");
+    без указания струн, если аккорд нельзя сыграть в заданном строе.
+    """
+    strings = [f"\\{string}" for string, _ in position] if position else [""] * len(chord)
+    return "<" + " ".join(LILYPOND_PITCHES[pitch] + string for pitch, string in zip(chord, strings)) + ">"
+
+def write_tabs_source(notes, output_path, fingering=None):
+    """
+    Сохранение кода табулатуры в .ly-файл рядом с будущим PDF.
+    :param fingering: Настройки аппликатуры (строй, лады).
+    :return: Путь к .ly-файлу.
     """
-    lilypond_code = generate_lilypond_tab_code(notes)
     ly_file_path = output_path.replace(".pdf", ".ly")
-    with open(ly_file_path, 'w') as file:
-        file.write(lilypond_code)
-    lilypond_file = abjad.LilyPondFile(items=[lilypond_code])
-    abjad.persist.as_pdf(lilypond_file, output_path)
-    print(f"PDF файл сохранён: {output_path}")
+    write_text_atomic(ly_file_path, generate_lilypond_tab_code(notes, fingering))
+    return ly_file_path
 
-def load_json(input_path):
+def notes_to_tabs(notes, output_path, fingering=None):
     """
-    Загружает данные из JSON файла.
-    :param input_path: Путь к файлу.
-    :return: Объект с нотами.
+    Генерация табулатуры в формате PDF.
+    :param fingering: Настройки аппликатуры (строй, лады); по умолчанию стандартный строй.
     """
-    with open(input_path, 'r') as file:
-        data = json.load(file)
-    notes_array = [Note(note["pitch"], note["duration"], note["velocity"]) for note in data["notesArray"]]
-    return Notes(notes_array)
+    ly_file_path = write_tabs_source(notes, output_path, fingering)
+    render_file(ly_file_path, output_path)
+    print(f"PDF файл сохранён: {output_path}")
 
 if __name__ == "__main__":
-    input_path = f"../data/{file_name}_input.json"  # Путь к JSON-файлу
+    file_name = file_name_from_argv()
+    input_path = f"../data/{file_name}_notes.bin"  # Путь к файлу нот (двоичный формат или JSON)
     output_path = f"../output/{file_name}_TABS.pdf"  # Путь для сохранения
 
-    notes = load_json(input_path)
+    notes = load_notes(input_path)
     notes_to_tabs(notes, output_path)
@@ -0,0 +1,170 @@
+import numpy as np
+from decode_audio import as_sound
+from classes.notes import DEFAULT_TEMPO
+
+# Параметры анализа: шаг кадров совпадает с шагом кадров высоты
+ONSET_TIME_STEP = 0.01
+ONSET_WINDOW = 0.032
+
+# Сжатие амплитуд перед разностью спектров: log(1 + ONSET_COMPRESSION * амплитуда)
+ONSET_COMPRESSION = 100.0
+
+# Границы оценки темпа (ударов в минуту)
+MIN_TEMPO = 40
+MAX_TEMPO = 240
+
+
+def onset_strength(signal, sample_rate, start_time=0.0, time_step=ONSET_TIME_STEP, window=ONSET_WINDOW, block_size=512):
+    """
+    Кривая новизны (спектральный поток): сумма положительных приращений
+    логарифмического спектра между соседними кадрами.
+
+    Спектр считается блоками по block_size кадров, поэтому память не зависит
+    от длины записи.
+
+    :param signal: Моно-сигнал.
+    :param sample_rate: Частота дискретизации (Гц).
+    :param start_time: Время первого отсчёта сигнала (в секундах).
+    :param time_step: Шаг кадров (в секундах).
+    :param window: Длина окна анализа (в секундах).
+    :param block_size: Количество кадров в блоке.
+    :return: Кортеж (время центра каждого кадра, новизна каждого кадра).
+    """
+    frame_length = int(round(window * sample_rate))
+    hop = max(1, int(round(time_step * sample_rate)))
+    count = max(0, (len(signal) - frame_length) // hop + 1)
+    times = start_time + (np.arange(count) * hop + frame_length / 2) / sample_rate
+    novelty = np.zeros(count)
+    if not count:
+        return times, novelty
+
+    taper = np.hanning(frame_length)
+    fft_size = 1 << (frame_length - 1).bit_length()
+    frames = np.lib.stride_tricks.sliding_window_view(signal, frame_length)[::hop]
+    previous = None
+    for start in range(0, count, block_size):
+        spectrum = np.log1p(ONSET_COMPRESSION * np.abs(np.fft.rfft(frames[start:start + block_size] * taper, n=fft_size, axis=1)))
+        # Первый кадр блока сравнивается с последним кадром предыдущего блока
+        reference = np.concatenate([spectrum[:1] if previous is None else previous, spectrum[:-1]])
+        novelty[start:start + len(spectrum)] = np.maximum(spectrum - reference, 0).sum(axis=1)
+        previous = spectrum[-1:]
+    return times, novelty
+
+
+def pick_onsets(times, novelty, threshold=0.1, min_interval=0.05, mean_window=0.1):
+    """
+    Выбор начал нот на кривой новизны: локальные максимумы в окне ±min_interval,
+    превышающие скользящее среднее в окне ±mean_window на threshold (в долях максимума).
+
+    :param times: Время каждого кадра (в секундах).
+    :param novelty: Новизна каждого кадра.
+    :param threshold: Превышение над скользящим средним (в долях максимума новизны).
+    :param min_interval: Минимальный интервал между началами нот (в секундах).
+    :param mean_window: Полуширина окна скользящего среднего (в секундах).
+    :return: Массив времён начал нот (в секундах).
+    """
+    if len(novelty) < 2 or not novelty.max() > 0:
+        return np.zeros(0)
+    time_step = times[1] - times[0]
+    novelty = novelty / novelty.max()
+
+    # Локальный максимум: не меньше соседей в окне и строго больше предыдущего кадра (первая точка плато)
+    radius = max(1, int(round(min_interval / time_step)))
+    padded = np.pad(novelty, radius, constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1).max(axis=1)
+    rising = np.concatenate([[True], novelty[1:] > novelty[:-1]])
+
+    # Скользящее среднее через накопленную сумму
+    span = max(1, int(round(mean_window / time_step)))
+    cumulative = np.concatenate([[0.0], np.cumsum(novelty)])
+    low = np.maximum(np.arange(len(novelty)) - span, 0)
+    high = np.minimum(np.arange(len(novelty)) + span + 1, len(novelty))
+    mean = (cumulative[high] - cumulative[low]) / (high - low)
+
+    peaks = (novelty == local_max) & rising & (novelty >= mean + threshold)
+    return times[peaks]
+
+
+def detect_onsets(wav_file, threshold=0.1, min_interval=0.05):
+    """
+    Поиск начал нот в записи.
+
+    :param wav_file: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :param threshold: Превышение новизны над скользящим средним (в долях максимума).
+    :param min_interval: Минимальный интервал между началами нот (в секундах).
+    :return: Массив времён начал нот (в секундах).
+    """
+    return analyze_onsets(wav_file, threshold, min_interval)["onsets"]
+
+
+def analyze_onsets(wav_file, threshold=0.1, min_interval=0.05):
+    """
+    Начала нот и кривая новизны записи (кривая нужна для оценки темпа).
+
+    :param wav_file: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :param threshold: Превышение новизны над скользящим средним (в долях максимума).
+    :param min_interval: Минимальный интервал между началами нот (в секундах).
+    :return: Словарь массивов: onsets (начала нот, в секундах), onset_envelope (новизна с шагом ONSET_TIME_STEP).
+    """
+    snd = as_sound(wav_file)
+    times, novelty = onset_strength(snd.values.mean(axis=0), snd.sampling_frequency, snd.xmin)
+    return {
+        "onsets": pick_onsets(times, novelty, threshold, min_interval),
+        "onset_envelope": novelty.astype(np.float32)
+    }
+
+
+def estimate_tempo(envelope, time_step=ONSET_TIME_STEP, min_tempo=MIN_TEMPO, max_tempo=MAX_TEMPO, prior_tempo=DEFAULT_TEMPO, prior_width=1.0):
+    """
+    Оценка темпа по автокорреляции кривой новизны.
+
+    Из кривой вычитается скользящее среднее (остаются всплески начал нот),
+    автокорреляция считается через БПФ (O(n log n)). Для задержек, соответствующих
+    темпам от min_tempo до max_tempo, периодичность оценивается по задержке и
+    удвоенной задержке (доля и такт из двух долей), что отсекает темпы 3:2 от
+    настоящего; логнормальный вес вокруг prior_tempo (ширина prior_width октав)
+    разрешает выбор между вдвое более быстрым и вдвое более медленным темпом.
+
+    :param envelope: Кривая новизны (см. onset_strength).
+    :param time_step: Шаг кадров кривой (в секундах).
+    :param min_tempo: Минимальный темп (ударов в минуту).
+    :param max_tempo: Максимальный темп (ударов в минуту).
+    :param prior_tempo: Наиболее вероятный темп (ударов в минуту).
+    :param prior_width: Ширина распределения темпа (в октавах).
+    :return: Темп (целое число ударов в минуту) или DEFAULT_TEMPO, если периодичности нет.
+    """
+    envelope = np.asarray(envelope, dtype=float)
+    max_lag = int(np.ceil(60 / (min_tempo * time_step)))
+    min_lag = max(1, int(np.floor(60 / (max_tempo * time_step))))
+    if len(envelope) < 2 * max_lag or not envelope.any():
+        return DEFAULT_TEMPO
+
+    # Всплески над скользящим средним в окне ±0.5 с (через накопленную сумму)
+    span = max(1, int(round(0.5 / time_step)))
+    cumulative = np.concatenate([[0.0], np.cumsum(envelope)])
+    positions = np.arange(len(envelope))
+    low = np.maximum(positions - span, 0)
+    high = np.minimum(positions + span + 1, len(envelope))
+    envelope = np.maximum(envelope - (cumulative[high] - cumulative[low]) / (high - low), 0)
+    envelope -= envelope.mean()
+
+    size = 1 << (2 * len(envelope) - 1).bit_length()
+    spectrum = np.fft.rfft(envelope, n=size)
+    autocorrelation = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=size)[:2 * max_lag + 2]
+    if not autocorrelation[0] > 0:
+        return DEFAULT_TEMPO
+
+    lags = np.arange(min_lag, max_lag + 1)
+    tempos = 60 / (lags * time_step)
+    weights = np.exp(-0.5 * (np.log2(tempos / prior_tempo) / prior_width) ** 2)
+    scores = (autocorrelation[lags] + 0.5 * autocorrelation[2 * lags]) * weights
+    best = int(np.argmax(scores))
+    if not scores[best] > 0:
+        return DEFAULT_TEMPO
+
+    # Уточнение задержки параболической интерполяцией
+    lag = float(lags[best])
+    a, b, c = autocorrelation[lags[best] - 1], autocorrelation[lags[best]], autocorrelation[lags[best] + 1]
+    if a - 2 * b + c < 0:
+        lag += 0.5 * (a - c) / (a - 2 * b + c)
+    return int(round(60 / (lag * time_step)))
@@ -0,0 +1,417 @@
+import os
+import sys
+import shutil
+import time
+
+# Добавляем папку scripts в sys.path, чтобы модуль можно было импортировать из корня проекта
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from classes.notes import Notes
+from json_to_notes import save_json
+from classes.job import Job, RESULT_SUFFIXES
+from recognition import recognize, recognize_contours, extract_contours, save_contours, load_contours, DEFAULT_PITCH_BACKEND, CONTOURS_VERSION
+from polyphony import recognize_chords, recognize_candidates, chord_candidates, save_candidates, load_candidates
+from decode_audio import load_sound, DEFAULT_SAMPLE_RATE, DEFAULT_CHANNELS
+from notes_to_midi import notes_to_midi
+from notes_to_sheet_music import notes_to_sheet_music, write_sheet_music_source
+from notes_to_tabs import notes_to_tabs, write_tabs_source
+from cache import ResultCache, audio_key, notes_key
+from metrics import StageTimer, timed
+
+# Функции генерации результата для каждого действия
+ACTIONS = {
+    'midi': notes_to_midi,
+    'nots': notes_to_sheet_music,
+    'tabulatures': notes_to_tabs
+}
+
+# Действия с PDF-результатом: функции, сохраняющие только код LilyPond.
+# Сам PDF при render=False создаёт LilyPondService в основном процессе.
+LILYPOND_SOURCES = {
+    'nots': write_sheet_music_source,
+    'tabulatures': write_tabs_source
+}
+
+# Параметры распознавания по умолчанию (входят в ключ кэша нот)
+RECOGNITION_PARAMS = {
+    'intensity_threshold': 0.4,
+    'contrast_factor': 2,
+    'max_freq_diff': 1.0,
+    'intensity_spike_threshold': 0.1,
+    'decay_threshold': 0.2,
+    'min_note_duration': 0.1
+}
+
+# Параметры распознавания аккордов по умолчанию (см. polyphony.chord_notes)
+CHORD_PARAMS = {
+    'intensity_threshold': 0.05,
+    'decay_threshold': 0.1,
+    'min_note_duration': 0.1
+}
+
+# Режимы распознавания и их параметры по умолчанию: одноголосная мелодия или аккорды
+MODES = {
+    'melody': RECOGNITION_PARAMS,
+    'chords': CHORD_PARAMS
+}
+
+# Максимальный размер каждого из кэшей (в байтах)
+CACHE_MAX_BYTES = int(os.environ.get('BARDDO_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+# Во сколько раз снижаются пороги при повторе "чувствительнее"
+SENSITIVITY_FACTOR = 0.7
+
+# Параметры, которые снижаются при повышении чувствительности
+SENSITIVITY_PARAMS = ('intensity_threshold', 'decay_threshold', 'min_note_duration')
+
+# Кэши контуров и результатов для каждой корневой папки (создаются при первом задании)
+_caches = {}
+
+
+def get_caches(root: str):
+    """
+    Кэш контуров высоты и интенсивности (по хэшу аудио) и кэш результатов
+    (по хэшу нот и типу результата).
+
+    :param root: Корневая папка проекта.
+    :return: Кортеж (кэш контуров, кэш результатов).
+    """
+    if root not in _caches:
+        _caches[root] = (
+            ResultCache(os.path.join(root, 'cache', 'contours'), CACHE_MAX_BYTES),
+            ResultCache(os.path.join(root, 'cache', 'results'), CACHE_MAX_BYTES)
+        )
+    return _caches[root]
+
+
+def restore_from_cache(cache: ResultCache, key: str, suffix: str, target_path: str) -> bool:
+    """
+    Копирование файла из кэша.
+
+    :return: True, если файл найден и скопирован.
+    """
+    cached_path = cache.get(key, suffix)
+    if cached_path is None:
+        return False
+    try:
+        shutil.copyfile(cached_path, target_path)
+    except FileNotFoundError:
+        # Файл успели вытеснить из кэша в другом процессе
+        return False
+    return True
+
+
+def mode_params(mode: str, params: dict = None) -> dict:
+    """
+    Параметры распознавания режима: значения по умолчанию, дополненные переданными.
+
+    :param mode: Режим: 'melody' или 'chords'.
+    :param params: Параметры поверх значений по умолчанию.
+    :return: Полный набор параметров.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Неверный режим распознавания: {mode}")
+    return {**MODES[mode], **(params or {})}
+
+
+def more_sensitive(params: dict, mode: str = 'melody') -> dict:
+    """
+    Параметры распознавания с пониженными порогами (находят более тихие и короткие ноты).
+
+    :param params: Текущие параметры (поверх параметров режима по умолчанию).
+    :param mode: Режим: 'melody' или 'chords'.
+    :return: Новые параметры.
+    """
+    params = mode_params(mode, params)
+    for name in SENSITIVITY_PARAMS:
+        params[name] = round(params[name] * SENSITIVITY_FACTOR, 4)
+    return params
+
+
+def run_recognition(input_path: str, notes_path: str, tempo: int = None, **params) -> Notes:
+    """
+    Распознавание нот в аудиофайле.
+
+    :param input_path: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :param notes_path: Путь для сохранения промежуточного файла нот (.json — JSON, иначе двоичный).
+    :param tempo: Темп (ударов в минуту); None — определить по записи.
+    :param params: Параметры распознавания (см. RECOGNITION_PARAMS).
+    :return: Объект Notes.
+    """
+    output_data = recognize(input_path, notes_path, tempo, **params)
+    return Notes.from_json(output_data)
+
+
+def run_action(action: str, notes: Notes, output_path: str, render: bool = True) -> str:
+    """
+    Генерация результата (MIDI, ноты, табулатуры) из распознанных нот.
+
+    :param action: Действие: 'midi', 'nots' или 'tabulatures'.
+    :param notes: Объект Notes.
+    :param output_path: Путь для сохранения результата.
+    :param render: False — для PDF-результатов только сохранить код LilyPond.
+    :return: Путь к файлу результата (или к .ly-файлу, который нужно отрендерить).
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Неверное действие: {action}")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if not render and action in LILYPOND_SOURCES:
+        return LILYPOND_SOURCES[action](notes, output_path)
+    ACTIONS[action](notes, output_path)
+    return output_path
+
+
+def needs_rendering(path: str) -> bool:
+    """
+    Проверка, что результат — код LilyPond, ожидающий рендеринга в PDF.
+    """
+    return path.endswith('.ly')
+
+
+def process_file(action: str, input_path: str, data_folder: str, output_folder: str, tempo: int = None) -> str:
+    """
+    Полный цикл обработки: распознавание -> Notes -> MIDI/ноты/табулатуры.
+
+    :param action: Действие: 'midi', 'nots' или 'tabulatures'.
+    :param input_path: Путь к WAV-файлу.
+    :param data_folder: Папка для промежуточного файла нот.
+    :param output_folder: Папка для результата.
+    :param tempo: Темп (ударов в минуту); None — определить по записи.
+    :return: Путь к файлу результата.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Неверное действие: {action}")
+
+    file_name = os.path.splitext(os.path.basename(input_path))[0]
+    notes_path = os.path.join(data_folder, f"{file_name}_notes.bin")
+    output_path = os.path.join(output_folder, f"{file_name}{RESULT_SUFFIXES[action]}")
+
+    notes = run_recognition(input_path, notes_path, tempo)
+    return run_action(action, notes, output_path)
+
+
+def convert_file(input_path: str, output_folder: str, actions, tempo: int = None, sample_rate: int = DEFAULT_SAMPLE_RATE, channels: int = DEFAULT_CHANNELS, params: dict = None, render: bool = True, export_json: bool = False, pitch_backend: str = None, mode: str = 'melody', file_name: str = None) -> dict:
+    """
+    Конвертация одного файла сразу в несколько результатов (одно распознавание на все).
+
+    :param input_path: Путь к аудиофайлу.
+    :param output_folder: Папка для промежуточного файла нот и результатов.
+    :param actions: Список действий: 'midi', 'nots', 'tabulatures'.
+    :param tempo: Темп (ударов в минуту); None — определить по записи.
+    :param sample_rate: Частота дискретизации декодированного аудио (Гц).
+    :param channels: Количество каналов декодированного аудио.
+    :param params: Параметры распознавания (поверх параметров режима по умолчанию).
+    :param render: False — для PDF-результатов только сохранить код LilyPond.
+    :param export_json: Дополнительно сохранить ноты в JSON (notesArray).
+    :param pitch_backend: Детектор высоты ('praat', 'yin'; по умолчанию DEFAULT_PITCH_BACKEND).
+    :param mode: Режим: 'melody' — мелодия, 'chords' — аккорды.
+    :param file_name: Основа имён результатов (по умолчанию имя файла без расширения).
+    :return: Пути к результатам и к файлу нот, время каждого этапа (в секундах).
+    """
+    for action in actions:
+        if action not in ACTIONS:
+            raise ValueError(f"Неверное действие: {action}")
+
+    params = mode_params(mode, params)
+    file_name = file_name or os.path.splitext(os.path.basename(input_path))[0]
+    os.makedirs(output_folder, exist_ok=True)
+    timings = {}
+
+    start = time.perf_counter()
+    snd = load_sound(input_path, sample_rate, channels)
+    timings['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    notes_path = os.path.join(output_folder, f"{file_name}_notes.bin")
+    if mode == 'chords':
+        notes = Notes.from_json(recognize_chords(snd, notes_path, tempo, **params))
+    else:
+        notes = run_recognition(snd, notes_path, tempo, pitch_backend=pitch_backend, **params)
+    timings['recognition'] = time.perf_counter() - start
+    if export_json:
+        save_json(notes, os.path.join(output_folder, f"{file_name}_input.json"))
+
+    outputs = {}
+    for action in actions:
+        start = time.perf_counter()
+        outputs[action] = run_action(action, notes, os.path.join(output_folder, f"{file_name}{RESULT_SUFFIXES[action]}"), render)
+        timings[action] = time.perf_counter() - start
+
+    return {"outputs": outputs, "timings": timings, "notes": len(notes.notes), "notes_path": notes_path}
+
+
+def run_job(job: Job, action: str, tempo: int = None, sample_rate: int = DEFAULT_SAMPLE_RATE, channels: int = DEFAULT_CHANNELS, params: dict = None, render: bool = True, pitch_backend: str = None, mode: str = 'melody', timer: StageTimer = None) -> dict:
+    """
+    Обработка задания: все файлы читаются и пишутся только в папки задания.
+    Повторные запросы с тем же аудио и параметрами берут ноты и результат из кэша.
+
+    Ноты, .ly-файл и результат каждого вызова лежат в папке варианта (по ключу
+    результата), поэтому одновременные действия задания с разными параметрами
+    или режимом не перезаписывают файлы друг друга.
+
+    :param job: Контекст задания.
+    :param action: Действие: 'midi', 'nots' или 'tabulatures'.
+    :param tempo: Темп (ударов в минуту); None — определить по записи.
+    :param sample_rate: Частота дискретизации декодированного аудио (Гц).
+    :param channels: Количество каналов декодированного аудио.
+    :param params: Параметры распознавания (поверх параметров режима по умолчанию).
+    :param render: False — для PDF-результатов только сохранить код LilyPond;
+                   после рендеринга результат кладётся в кэш через cache_result(job, action, key).
+    :param pitch_backend: Детектор высоты ('praat', 'yin'; по умолчанию DEFAULT_PITCH_BACKEND).
+    :param mode: Режим: 'melody' — мелодия, 'chords' — аккорды.
+    :param timer: StageTimer для замера этапов и учёта попаданий в кэш (необязательно).
+    :return: Словарь: path (путь к результату или к .ly-файлу, который нужно отрендерить),
+             key (ключ результата в кэше, по нему же строятся пути варианта).
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Неверное действие: {action}")
+
+    params = mode_params(mode, params)
+    job.prepare()
+    contours_cache, results_cache = get_caches(job.root)
+
+    # Шаг 1: контуры (или кандидаты аккордов) из папки задания, из кэша или анализом звука;
+    # ноты по ним считаются быстро, поэтому смена параметров не требует повторного анализа.
+    # Ноты пишутся во временный файл процесса: ключ варианта известен только после распознавания
+    temp_notes_path = f"{job.notes_path}.{os.getpid()}.part"
+    if mode == 'chords':
+        candidates = load_job_candidates(job, contours_cache, sample_rate, channels, timer)
+        with timed(timer, 'segmentation'):
+            notes = Notes.from_json(recognize_candidates(candidates, temp_notes_path, tempo, **params))
+    else:
+        contours = load_job_contours(job, contours_cache, sample_rate, channels, pitch_backend, timer)
+        with timed(timer, 'segmentation'):
+            notes = Notes.from_json(recognize_contours(contours, temp_notes_path, tempo, **params))
+
+    key = notes_key(notes, action)
+    notes_path = job.notes_path_for(key)
+    os.makedirs(os.path.dirname(notes_path), exist_ok=True)
+    os.replace(temp_notes_path, notes_path)
+
+    # Шаг 2: результат из кэша или генерация
+    result_path = job.result_path(action, key)
+    os.makedirs(os.path.dirname(result_path), exist_ok=True)
+    if restore_from_cache(results_cache, key, RESULT_SUFFIXES[action], result_path):
+        record_event(timer, 'results_hit')
+        return {"path": result_path, "key": key}
+    record_event(timer, 'results_miss')
+
+    with timed(timer, 'render'):
+        output_path = run_action(action, notes, result_path, render)
+    if not needs_rendering(output_path):
+        results_cache.put(key, result_path, RESULT_SUFFIXES[action])
+    return {"path": output_path, "key": key}
+
+
+def run_job_timed(job: Job, action: str, **kwargs) -> dict:
+    """
+    Обработка задания (run_job) с замером этапов: время и события возвращаются
+    родительскому процессу вместе с результатом.
+
+    :param job: Контекст задания.
+    :param action: Действие: 'midi', 'nots' или 'tabulatures'.
+    :param kwargs: Параметры run_job.
+    :return: Словарь: path (путь к результату или .ly-файлу), key (ключ результата),
+             timings (время этапов, в секундах), events (попадания и промахи кэшей).
+    """
+    timer = StageTimer()
+    result = run_job(job, action, timer=timer, **kwargs)
+    return {**result, "timings": timer.timings, "events": timer.events}
+
+
+def record_event(timer: StageTimer, name: str) -> None:
+    """
+    Учёт события, если таймер задан.
+    """
+    if timer is not None:
+        timer.event(name)
+
+
+def load_job_contours(job: Job, contours_cache: ResultCache, sample_rate: int = DEFAULT_SAMPLE_RATE, channels: int = DEFAULT_CHANNELS, pitch_backend: str = None, timer: StageTimer = None) -> dict:
+    """
+    Контуры высоты и интенсивности задания. Сохраняются в папке задания (.npz),
+    поэтому повторные действия с тем же файлом не декодируют и не анализируют звук.
+
+    :param job: Контекст задания.
+    :param contours_cache: Кэш контуров (по хэшу декодированного аудио).
+    :param sample_rate: Частота дискретизации декодированного аудио (Гц).
+    :param channels: Количество каналов декодированного аудио.
+    :param pitch_backend: Детектор высоты ('praat', 'yin'; по умолчанию DEFAULT_PITCH_BACKEND).
+    :param timer: StageTimer для замера этапов (decode, pitch, intensity, onsets) и учёта попаданий в кэш.
+    :return: Словарь массивов times, frequencies, intensities.
+    """
+    if os.path.exists(job.contours_path):
+        record_event(timer, 'contours_hit')
+        return load_contours(job.contours_path)
+
+    # Аудио декодируется сразу в память, без промежуточного WAV-файла
+    with timed(timer, 'decode'):
+        snd = load_sound(job.input_path, sample_rate, channels)
+    pitch_backend = pitch_backend or DEFAULT_PITCH_BACKEND
+    key = audio_key(snd.values, sample_rate, {'channels': channels, 'pitch_backend': pitch_backend, 'version': CONTOURS_VERSION})
+    if restore_from_cache(contours_cache, key, '.npz', job.contours_path):
+        record_event(timer, 'contours_hit')
+        return load_contours(job.contours_path)
+    record_event(timer, 'contours_miss')
+
+    contours = extract_contours(snd, pitch_backend, timer)
+    save_contours(job.contours_path, contours)
+    contours_cache.put(key, job.contours_path, '.npz')
+    return contours
+
+
+def load_job_candidates(job: Job, contours_cache: ResultCache, sample_rate: int = DEFAULT_SAMPLE_RATE, channels: int = DEFAULT_CHANNELS, timer: StageTimer = None) -> dict:
+    """
+    Кандидаты многоголосия задания (режим аккордов). Хранятся так же, как контуры:
+    в папке задания и в кэше контуров по хэшу аудио.
+
+    :param job: Контекст задания.
+    :param contours_cache: Кэш контуров (по хэшу декодированного аудио).
+    :param sample_rate: Частота дискретизации декодированного аудио (Гц).
+    :param channels: Количество каналов декодированного аудио.
+    :param timer: StageTimer для замера этапов (decode, polyphony) и учёта попаданий в кэш.
+    :return: Словарь массивов times, notes, salience.
+    """
+    if os.path.exists(job.candidates_path):
+        record_event(timer, 'contours_hit')
+        return load_candidates(job.candidates_path)
+
+    with timed(timer, 'decode'):
+        snd = load_sound(job.input_path, sample_rate, channels)
+    key = audio_key(snd.values, sample_rate, {'channels': channels, 'mode': 'chords'})
+    if restore_from_cache(contours_cache, key, '.npz', job.candidates_path):
+        record_event(timer, 'contours_hit')
+        return load_candidates(job.candidates_path)
+    record_event(timer, 'contours_miss')
+
+    with timed(timer, 'polyphony'):
+        candidates = chord_candidates(snd)
+    save_candidates(job.candidates_path, candidates)
+    contours_cache.put(key, job.candidates_path, '.npz')
+    return candidates
+
+
+def cache_result(job: Job, action: str, key: str) -> None:
+    """
+    Сохранение готового результата задания в кэш (для PDF, отрендеренных
+    вне рабочего процесса).
+
+    :param job: Контекст задания.
+    :param action: Действие: 'midi', 'nots' или 'tabulatures'.
+    :param key: Ключ результата, вычисленный рабочим процессом (run_job); файл нот
+                не перечитывается, так как его мог перезаписать другой вызов.
+    """
+    _, results_cache = get_caches(job.root)
+    results_cache.put(key, job.result_path(action, key), RESULT_SUFFIXES[action])
+
+
+def cache_stats() -> dict:
+    """
+    Счётчики попаданий и промахов кэшей текущего процесса.
+    """
+    stats = {"contours": {"hits": 0, "misses": 0}, "results": {"hits": 0, "misses": 0}}
+    for contours_cache, results_cache in _caches.values():
+        for name, cache in (("contours", contours_cache), ("results", results_cache)):
+            for counter, value in cache.stats().items():
+                stats[name][counter] += value
+    return stats
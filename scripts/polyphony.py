@@ -0,0 +1,281 @@
+import os
+import numpy as np
+from decode_audio import as_sound
+from recognition import round_to_note_durations, midi_to_note, write_notes, detect_tempo
+from onsets import analyze_onsets
+
+# Ноты гитарного диапазона (E2 ~ E6) в MIDI-номерах
+CHORD_MIN_MIDI = 40
+CHORD_MAX_MIDI = 88
+
+# Сколько гармоник учитывается в сумме и во сколько раз ослабевает вес каждой следующей
+HARMONICS = 6
+HARMONIC_DECAY = 0.8
+
+# Смещение h-й гармоники от основного тона (в полутонах): 0, 12, 19, 24, 28, 31, ...
+HARMONIC_OFFSETS = np.round(12 * np.log2(np.arange(1, HARMONICS + 1))).astype(np.int64)
+
+# Наибольшее число нот в аккорде (по числу струн гитары)
+MAX_CHORD_NOTES = 6
+
+# Сетка начала нот (в долях четверти): 0.125 — тридцать вторая
+ONSET_GRID = 0.125
+
+
+def spectral_peaks(magnitude, sample_rate, fft_size, floor=0.03, min_midi=CHORD_MIN_MIDI, max_midi=CHORD_MAX_MIDI + HARMONIC_OFFSETS[-1]):
+    """
+    Пики спектра, разложенные по полутонам: для каждого кадра и каждой ноты —
+    амплитуда самого сильного пика, частота которого ближе всего к этой ноте.
+    Частота пика уточняется параболической интерполяцией, поэтому точность
+    выше шага бинов БПФ.
+
+    :param magnitude: Амплитудные спектры формы (кадры, бины).
+    :param sample_rate: Частота дискретизации (Гц).
+    :param fft_size: Размер БПФ.
+    :param floor: Пики слабее floor от самого сильного пика кадра не учитываются.
+    :return: Матрица формы (кадры, ноты от min_midi до max_midi).
+    """
+    peaks = np.zeros((len(magnitude), max_midi - min_midi + 1))
+    left, center, right = magnitude[:, :-2], magnitude[:, 1:-1], magnitude[:, 2:]
+    is_peak = (center > left) & (center >= right) & (center >= floor * magnitude.max(axis=1, keepdims=True))
+    rows, bins = np.nonzero(is_peak)
+    if not len(rows):
+        return peaks
+
+    # Параболическая интерполяция по логарифму амплитуды
+    a, b, c = (np.log(np.maximum(x[rows, bins], 1e-12)) for x in (left, center, right))
+    denominator = a - 2 * b + c
+    shift = np.where(denominator < 0, 0.5 * (a - c) / np.where(denominator < 0, denominator, 1), 0.0)
+    frequency = (bins + 1 + shift) * sample_rate / fft_size
+    amplitude = np.exp(b - 0.25 * (a - c) * shift)
+
+    midi = np.round(69 + 12 * np.log2(np.maximum(frequency, 1e-6) / 440.0)).astype(np.int64)
+    inside = (midi >= min_midi) & (midi <= max_midi)
+    np.maximum.at(peaks, (rows[inside], midi[inside] - min_midi), amplitude[inside])
+    return peaks
+
+
+def chord_candidates(wav_file, max_notes=6, time_step=0.01, window=0.1, block_size=1024):
+    """
+    Анализ многоголосия: для каждого кадра до max_notes нот-кандидатов с их силой.
+
+    Спектр (STFT) считается блоками по block_size кадров, поэтому весь спектр файла
+    в памяти не хранится. В каждом кадре нота с наибольшей суммой гармоник
+    выбирается, её гармоники вычитаются из пиков спектра (не больше, чем дают
+    плавно затухающие обертоны, поэтому совпадающие ноты аккорда остаются), и выбор
+    повторяется. Пороги к кандидатам не применяются — их применяет chord_notes,
+    поэтому результат можно сохранить и пересчитать ноты с другими порогами.
+
+    :param wav_file: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :param max_notes: Максимальное количество одновременных нот.
+    :param time_step: Шаг кадров (в секундах).
+    :param window: Длина окна анализа (в секундах).
+    :param block_size: Количество кадров в блоке.
+    :return: Словарь массивов: times (кадры), notes (MIDI-номера, -1 — нет кандидата), salience (сила),
+             onsets (начала нот, в секундах), onset_envelope (кривая новизны для оценки темпа).
+    """
+    snd = as_sound(wav_file)
+    signal = snd.values.mean(axis=0)
+    sample_rate = snd.sampling_frequency
+
+    frame_length = int(round(window * sample_rate))
+    hop = max(1, int(round(time_step * sample_rate)))
+    # Дополнение нулями вдвое: интерполяция пиков точнее
+    fft_size = 2 ** ((frame_length - 1).bit_length() + 1)
+
+    count = max(0, (len(signal) - frame_length) // hop + 1)
+    times = snd.xmin + (np.arange(count) * hop + frame_length / 2) / sample_rate
+    notes = np.full((count, max_notes), -1, dtype=np.int16)
+    salience = np.zeros((count, max_notes), dtype=np.float32)
+
+    # Окно Ханна, нормированное так, что синус с амплитудой 1 даёт пик около 1
+    taper = np.hanning(frame_length)
+    taper *= 2 / taper.sum()
+    frames = np.lib.stride_tricks.sliding_window_view(signal, frame_length)[::hop]
+
+    note_count = CHORD_MAX_MIDI - CHORD_MIN_MIDI + 1
+    weights = HARMONIC_DECAY ** np.arange(HARMONICS)
+    for start in range(0, count, block_size):
+        block = frames[start:start + block_size]
+        peaks = spectral_peaks(np.abs(np.fft.rfft(block * taper, n=fft_size, axis=1)), sample_rate, fft_size)
+        rows = np.arange(len(block))
+        for k in range(max_notes):
+            # Сумма гармоник; нота без пика на основном тоне не рассматривается
+            strength = sum(weight * peaks[:, offset:offset + note_count] for weight, offset in zip(weights, HARMONIC_OFFSETS))
+            strength[peaks[:, :note_count] <= 0] = 0
+            picked = strength.argmax(axis=1)
+            value = strength[rows, picked]
+            found = value > 0
+            notes[start + rows[found], k] = CHORD_MIN_MIDI + picked[found]
+            salience[start + rows[found], k] = value[found]
+
+            # Вычитаем гармоники выбранной ноты: не больше плавно затухающей огибающей
+            columns = picked[:, None] + HARMONIC_OFFSETS[None, :]
+            amplitude = peaks[rows[:, None], columns]
+            expected = amplitude[:, :1] * weights[None, :]
+            peaks[rows[:, None], columns] = amplitude - np.minimum(amplitude, expected)
+
+    return {"times": times, "notes": notes, "salience": salience, **analyze_onsets(snd)}
+
+
+def save_candidates(path, candidates):
+    """
+    Сохранение кандидатов многоголосия в сжатый файл .npz.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.part.npz"
+    np.savez_compressed(temp_path, **candidates)
+    os.replace(temp_path, path)
+
+
+def load_candidates(path):
+    """
+    Загрузка кандидатов многоголосия из файла .npz.
+
+    :return: Словарь массивов: times, notes, salience, onsets и onset_envelope (если сохранены).
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in ("times", "notes", "salience", "onsets", "onset_envelope") if name in data}
+
+
+def note_runs(active, max_gap, breaks=None):
+    """
+    Непрерывные участки звучания каждой ноты в матрице кадров.
+
+    :param active: Булева матрица формы (кадры, ноты).
+    :param max_gap: Пропуски не длиннее max_gap кадров не прерывают ноту.
+    :param breaks: Булев массив кадров, на которых начинаются новые ноты (звучащая нота
+                   начинается заново, пропуск перед ним не объединяется).
+    :return: Массивы (нота, первый кадр, кадр после последнего), упорядоченные по нотам и времени.
+    """
+    if breaks is None:
+        breaks = np.zeros(active.shape[0], dtype=bool)
+    padded = np.zeros((active.shape[0] + 2, active.shape[1]), dtype=np.int8)
+    padded[1:-1] = active
+    change = np.diff(padded, axis=0)
+    # Повторное начало звучащей ноты: конец прежнего участка и начало нового в одном кадре
+    restart = np.zeros_like(change, dtype=bool)
+    restart[1:-1] = active[1:] & active[:-1] & breaks[1:, None]
+    # Транспонируем, чтобы начала и концы шли по нотам, а внутри ноты — по времени
+    note, start = np.nonzero(((change == 1) | restart).T)
+    _, end = np.nonzero(((change == -1) | restart).T)
+    if not len(note):
+        return note, start, end
+
+    # Объединяем участки одной ноты с коротким пропуском, если в пропуске нет начала ноты
+    passed = np.cumsum(breaks)
+    joined = np.zeros(len(note), dtype=bool)
+    joined[1:] = (note[1:] == note[:-1]) & (start[1:] - end[:-1] <= max_gap) & (passed[start[1:]] == passed[end[:-1] - 1])
+    first = np.flatnonzero(~joined)
+    last = np.append(first[1:] - 1, len(note) - 1)
+    return note[first], start[first], end[last]
+
+
+def chord_notes(candidates, tempo, intensity_threshold=0.05, decay_threshold=0.1, min_note_duration=0.1, max_gap=0.03, chord_tolerance=0.05, max_chord_notes=MAX_CHORD_NOTES, velocity=85):
+    """
+    Ноты и аккорды из кандидатов многоголосия.
+
+    Кандидат звучит, если его сила не меньше intensity_threshold от самого громкого
+    кадра записи и не меньше decay_threshold от самой сильной ноты кадра.
+    Ноты, начавшиеся в пределах chord_tolerance, образуют аккорд с общим началом;
+    в аккорде остаются не больше max_chord_notes самых сильных нот.
+
+    :param candidates: Словарь массивов times, notes, salience (см. chord_candidates).
+    :param tempo: Темп (ударов в минуту).
+    :param intensity_threshold: Минимальная сила ноты относительно самого громкого кадра.
+    :param decay_threshold: Минимальная сила ноты относительно самой сильной ноты кадра.
+    :param min_note_duration: Минимальная длительность ноты (в секундах).
+    :param max_gap: Пропуск (в секундах), который не прерывает ноту.
+    :param chord_tolerance: Разброс начала нот одного аккорда (в секундах).
+    :param max_chord_notes: Наибольшее число нот в аккорде.
+    :param velocity: Сила нажатия нот.
+    :return: Список нот в формате notesArray (с началом onset в долях четверти).
+    """
+    times, notes, salience = candidates["times"], candidates["notes"], candidates["salience"]
+    if not len(times) or not salience.max() > 0:
+        return []
+    time_step = times[1] - times[0] if len(times) > 1 else 0.01
+
+    # 1. Пороги: громкость кадра относительно записи и сила ноты относительно кадра
+    strongest = salience[:, :1]
+    accepted = (notes >= 0) & (salience >= intensity_threshold * salience.max()) & (salience >= decay_threshold * strongest)
+    active = np.zeros((len(times), CHORD_MAX_MIDI - CHORD_MIN_MIDI + 1), dtype=bool)
+    frame, slot = np.nonzero(accepted)
+    active[frame, notes[frame, slot] - CHORD_MIN_MIDI] = True
+    strength = np.zeros(active.shape)
+    np.maximum.at(strength, (frame, notes[frame, slot] - CHORD_MIN_MIDI), salience[frame, slot])
+
+    # 2. Участки звучания каждой ноты (найденные начала нот прерывают звучащую ноту); короткие отбрасываем
+    breaks = None
+    if candidates.get("onsets") is not None:
+        breaks = np.zeros(len(times), dtype=bool)
+        breaks[np.minimum(np.searchsorted(times, candidates["onsets"]), len(times) - 1)] = True
+    note, start, end = note_runs(active, int(round(max_gap / time_step)), breaks)
+    durations = (end - start) * time_step
+    long_enough = durations >= min_note_duration
+    note, start, durations = note[long_enough], start[long_enough], durations[long_enough]
+    if not len(note):
+        return []
+    # Сила ноты — сила её первого кадра (атаки)
+    attack = strength[start, note]
+
+    # 3. Аккорды: ноты, начавшиеся почти одновременно, получают общее начало
+    order = np.argsort(start, kind='stable')
+    note, durations, attack, onsets = note[order], durations[order], attack[order], times[start[order]]
+    new_chord = np.concatenate([[True], np.diff(onsets) > chord_tolerance])
+    onsets = onsets[np.flatnonzero(new_chord)[np.cumsum(new_chord) - 1]]
+
+    # Внутри аккорда ноты идут снизу вверх, одна и та же нота остаётся один раз
+    order = np.lexsort((note, onsets))
+    note, onsets, durations, attack = note[order], onsets[order], durations[order], attack[order]
+    unique = np.concatenate([[True], (np.diff(onsets) > 0) | (np.diff(note) != 0)])
+    note, onsets, durations, attack = note[unique], onsets[unique], durations[unique], attack[unique]
+
+    # Слишком большие аккорды: остаются самые сильные ноты (порядок снизу вверх сохраняется)
+    chord = np.cumsum(np.concatenate([[True], np.diff(onsets) > 0])) - 1
+    by_strength = np.lexsort((-attack, chord))
+    rank = np.empty(len(note), dtype=np.int64)
+    rank[by_strength] = np.arange(len(note)) - np.searchsorted(chord, chord[by_strength])
+    keep = rank < max_chord_notes
+    note, onsets, durations = note[keep], onsets[keep], durations[keep]
+
+    # 4. Перевод времени в доли четверти
+    quarter_note_duration = 60 / tempo
+    beats = np.round((onsets - onsets[0]) / quarter_note_duration / ONSET_GRID) * ONSET_GRID
+    rounded = round_to_note_durations(durations, tempo)
+
+    return [
+        {
+            "pitch": midi_to_note(int(midi) + CHORD_MIN_MIDI),
+            "duration": duration,
+            "velocity": velocity,
+            "onset": float(onset)
+        }
+        for midi, duration, onset in zip(note.tolist(), rounded, beats.tolist())
+    ]
+
+
+def recognize_chords(input_path, output_path, tempo=None, **params):
+    """
+    Распознавание нот и аккордов (многоголосный режим) и сохранение результата.
+
+    :param input_path: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :param output_path: Путь для сохранения нот (.json — JSON, иначе двоичный формат).
+    :param tempo: Темп (ударов в минуту); None — оценить по записи.
+    :param params: Параметры chord_notes (пороги, минимальная длительность).
+    :return: JSON-структура с массивом нот и темпом.
+    """
+    return recognize_candidates(chord_candidates(input_path), output_path, tempo, **params)
+
+
+def recognize_candidates(candidates, output_path, tempo=None, **params):
+    """
+    Распознавание нот и аккордов по сохранённым кандидатам (без анализа звука)
+    и сохранение результата.
+
+    :param candidates: Словарь массивов times, notes, salience (см. chord_candidates).
+    :param tempo: Темп (ударов в минуту); None — оценить по кривой новизны кандидатов.
+    :return: JSON-структура с массивом нот и темпом.
+    """
+    tempo = tempo or detect_tempo(candidates)
+    return write_notes(chord_notes(candidates, tempo, **params), output_path, tempo)
@@ -1,10 +1,13 @@
-import parselmouth
 import numpy as np
 import json
+from abc import ABC, abstractmethod
 import os
-import classes.storage as storage
-
-file_name = storage.load_file_name()
+import wave
+from classes.job import file_name_from_argv
+from classes.notes import Notes
+from decode_audio import as_sound, make_sound
+from onsets import detect_onsets, analyze_onsets, estimate_tempo, DEFAULT_TEMPO
+from metrics import timed
 
 # Функция для округления длительности к ближайшей музыкальной длительности
 def round_to_note_duration(duration, tempo):
@@ -38,174 +41,782 @@ def limit_note_range(hz):
         
     return hz
 
-# Функция для усиления контраста звука
-def enhance_contrast(intensities, contrast_factor=10):
-    # Усиливаем пики и уменьшаем слабые звуки с помощью экспоненциального преобразования
-    enhanced_intensities = intensities ** contrast_factor
-    # Нормализуем результат для предотвращения значений больше 1.0
-    enhanced_intensities = np.clip(enhanced_intensities, 0, 1)
-    return enhanced_intensities
-
-# Функция для выравнивания пиков интенсивности сигнала
-def normalize_peaks(intensities, target_peak=1.0):
-    # Приводим интенсивности к целевому пику
-    max_intensity = np.max(intensities)
-    if max_intensity > 0:
-        return intensities * (target_peak / max_intensity)
+# Подготовка интенсивности к сегментации: нормализация, усиление контраста, подавление скачков
+def enhance_contrast(intensities, contrast_factor=2, peak=None):
+    """
+    Нормализация по пику и усиление контраста на месте (без промежуточных массивов).
+
+    Интенсивность (в дБ) сначала делится на пик и ограничивается отрезком [0, 1],
+    затем возводится в степень contrast_factor: пик остаётся 1, тихие кадры
+    ослабляются тем сильнее, чем дальше они от пика.
+
+    :param intensities: Интенсивность каждого кадра (массив float, изменяется на месте).
+    :param contrast_factor: Степень усиления контраста.
+    :param peak: Пик для нормализации (по умолчанию максимум intensities).
+    :return: Тот же массив.
+    """
+    if not len(intensities):
+        return intensities
+    peak = np.max(intensities) if peak is None else peak
+    if peak > 0:
+        intensities *= 1.0 / peak
+    np.clip(intensities, 0, 1, out=intensities)
+    np.power(intensities, contrast_factor, out=intensities)
     return intensities
 
-# Функция для фильтрации интенсивных всплесков (например, при скрежете)
-def filter_intensity_spikes(intensities, threshold=0.1):
-    # Фильтруем интенсивности, удаляя резкие скачки
-    filtered = []
-    for i in range(1, len(intensities)):
-        if abs(intensities[i] - intensities[i-1]) < threshold:
-            filtered.append(intensities[i])
-        else:
-            filtered.append(intensities[i-1])  # Если скачок большой, заменяем на предыдущую интенсивность
-    return np.array(filtered)
+def filter_intensity_spikes(intensities, threshold=0.1, previous=None):
+    """
+    Подавление резких скачков интенсивности (например, при скрежете) на месте:
+    кадр, отличающийся от предыдущего кадра на threshold и больше, заменяется
+    его значением. Длина массива не меняется, кадры остаются выровнены с кадрами высоты.
+
+    :param intensities: Интенсивность каждого кадра (массив float, изменяется на месте).
+    :param threshold: Порог скачка.
+    :param previous: Интенсивность кадра перед первым (при потоковой обработке).
+    :return: Тот же массив.
+    """
+    if not len(intensities):
+        return intensities
+    first = intensities[0]
+    jumps = np.diff(intensities)
+    np.abs(jumps, out=jumps)
+    spikes = jumps >= threshold
+    # Значения справа берутся до присваивания, поэтому сравнение идёт с исходным предыдущим кадром
+    intensities[1:][spikes] = intensities[:-1][spikes]
+    if previous is not None and abs(first - previous) >= threshold:
+        intensities[0] = previous
+    return intensities
+
+def condition_intensities(intensities, contrast_factor=2, spike_threshold=0.1, copy=True):
+    """
+    Подготовка интенсивности к сегментации за один проход по памяти:
+    нормализация по пику, усиление контраста и подавление скачков.
+
+    :param intensities: Интенсивность каждого кадра высоты (в дБ).
+    :param contrast_factor: Степень усиления контраста.
+    :param spike_threshold: Порог скачка интенсивности.
+    :param copy: False — изменять массив на месте (он должен быть float64).
+    :return: Массив интенсивности той же длины со значениями в [0, 1].
+    """
+    intensities = np.array(intensities, dtype=float, copy=copy)
+    enhance_contrast(intensities, contrast_factor)
+    return filter_intensity_spikes(intensities, spike_threshold)
+
+def intensity_at(times, intensity):
+    """
+    Интенсивность в моменты кадров высоты: у Praat кадры интенсивности идут
+    с другим шагом, чем кадры высоты, поэтому значения интерполируются.
+
+    :param times: Время каждого кадра высоты (в секундах).
+    :param intensity: Объект parselmouth.Intensity.
+    :return: Интенсивность (в дБ) для каждого кадра высоты.
+    """
+    return np.interp(times, intensity.xs(), intensity.values[0])
 
 # Функция для создания трапециевидной огибающей
 def trapezoidal_envelope(signal, rise_time=0.1, fall_time=0.1, sample_rate=22050):
-    """Создает трапециевидную огибающую для сигнала."""
-    num_samples = len(signal)
-    rise_samples = int(rise_time * sample_rate)
-    fall_samples = int(fall_time * sample_rate)
-    
-    # Создание огибающей в форме трапеции
-    envelope = np.zeros(num_samples)
-    
-    # Восходящий фронт
-    envelope[:rise_samples] = np.linspace(0, 1, rise_samples)
-    
-    # Плато
-    envelope[rise_samples:num_samples - fall_samples] = 1
-    
-    # Нисходящий фронт
-    envelope[num_samples - fall_samples:] = np.linspace(1, 0, fall_samples)
-    
-    return signal * envelope
-
-# Функция для извлечения нот и их длительностей
-def get_notes_and_durations(wav_file, tempo, intensity_threshold=0.4, contrast_factor=10, max_freq_diff=1.0, intensity_spike_threshold=0.1, decay_threshold=0.2, min_note_duration=0.1):
-    # Загружаем аудиофайл с помощью parselmouth
-    snd = parselmouth.Sound(wav_file)
+    """
+    Трапециевидная огибающая (плавное нарастание в начале и спад в конце записи),
+    применяемая к сигналу на месте. Плато не трогается, поэтому память выделяется
+    только под наклонные участки (в типе сигнала, например float32).
+
+    :param signal: Сигнал (моно или массив формы (каналы, отсчёты)), изменяется на месте.
+    :param rise_time: Длительность нарастания (в секундах).
+    :param fall_time: Длительность спада (в секундах).
+    :param sample_rate: Частота дискретизации (Гц).
+    :return: Тот же массив.
+    """
+    num_samples = signal.shape[-1]
+    rise_samples = min(int(rise_time * sample_rate), num_samples)
+    fall_samples = min(int(fall_time * sample_rate), num_samples - rise_samples)
+    if rise_samples:
+        signal[..., :rise_samples] *= np.linspace(0, 1, rise_samples, dtype=signal.dtype)
+    if fall_samples:
+        signal[..., num_samples - fall_samples:] *= np.linspace(1, 0, fall_samples, dtype=signal.dtype)
+    return signal
+
+def condition_sound(snd, envelope_time=None):
+    """
+    Необязательная подготовка сигнала перед анализом. Выполняется на месте
+    в буфере отсчётов parselmouth.Sound (snd.values — представление, а не копия);
+    без включённых шагов ничего не делает и память не выделяет.
+
+    :param snd: Звук parselmouth.Sound (изменяется на месте).
+    :param envelope_time: Длительность нарастания и спада трапециевидной огибающей
+                          (в секундах); None — без огибающей.
+    :return: Тот же звук.
+    """
+    if envelope_time:
+        trapezoidal_envelope(snd.values, envelope_time, envelope_time, snd.sampling_frequency)
+    return snd
+
+# Названия нот в октаве (индекс = MIDI-номер % 12)
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Диапазон 6-струнной гитары (E2 ~ E6)
+GUITAR_MIN_HZ = 82.41
+GUITAR_MAX_HZ = 1318.51
+
+# Векторная версия round_to_note_duration для массива длительностей
+def round_to_note_durations(durations, tempo):
+    quarter_note_duration = 60 / tempo  # Длительность четверти
+    note_durations = [quarter_note_duration * (1 / (2 ** i)) for i in range(8)]  # 1, 0.5, 0.25, ...
+    # Готовые значения в долях четверти (те же, что возвращает round_to_note_duration)
+    rounded = [round(d / quarter_note_duration, 3) for d in note_durations]
+    # argmin, как и min, при равенстве выбирает первую (более длинную) длительность
+    closest = np.abs(np.asarray(durations)[:, None] - np.array(note_durations)[None, :]).argmin(axis=1)
+    return [rounded[i] for i in closest]
+
+# Векторная версия limit_note_range: сдвиг октавы для всего массива частот
+def limit_note_range_array(hz):
+    hz = np.array(hz, dtype=float)
+    # Умножение и деление на 2 точные, поэтому результат совпадает с покадровой версией
+    low = hz < GUITAR_MIN_HZ
+    while low.any():
+        hz[low] *= 2
+        low = hz < GUITAR_MIN_HZ
+    high = hz > GUITAR_MAX_HZ
+    while high.any():
+        hz[high] /= 2
+        high = hz > GUITAR_MAX_HZ
+    return hz
 
-    # Извлечение высоты звука (pitch) и интенсивности
-    pitch = snd.to_pitch()
-    intensity = snd.to_intensity()
-
-    # Конвертируем высоту звука в массив частот
-    times = pitch.xs()
-    frequencies = pitch.selected_array['frequency']
-    intensities = intensity.values.T.flatten()
-
-    # Применяем усиление контраста и выравнивание пиков
-    intensities = enhance_contrast(intensities, contrast_factor)
-    intensities = normalize_peaks(intensities)
-
-    # Фильтруем резкие изменения интенсивности (скрежет и дрожание)
-    intensities = filter_intensity_spikes(intensities, threshold=intensity_spike_threshold)
-
-    # Получаем аудиосигнал
-    signal = snd.values.T.flatten()
-    sample_rate = snd.xmax / len(signal)
-
-    # Применяем трапециевидную огибающую к сигналу
-    signal = trapezoidal_envelope(signal, rise_time=0.05, fall_time=0.05, sample_rate=sample_rate)
-
-    # Параметры для фильтрации
-    min_pitch = 50  # Минимальная частота для ноты (в Гц)
-    min_intensity = intensity_threshold  # Минимальная громкость (в дБ) для отбора пиков
-
-    # Обработка данных
-    notes_data = []
-    last_pitch = None
-    last_onset_time = 0
-    last_duration = 0
-    last_freq = None
-    last_intensity = None  # для отслеживания интенсивности предыдущей ноты
-    current_note_end_time = 0  # Время завершения текущей основной ноты
-
-    for i, freq in enumerate(frequencies):
-        if freq < min_pitch or intensities[i] < min_intensity:
-            continue  # Пропускаем шумы и тихие сигналы
-
-        # Ограничиваем частоту в пределах диапазона гитары
-        freq = limit_note_range(freq)
-
-        # Преобразование частоты в музыкальную ноту
-        pitch_note = hz_to_note(freq)
-
-        # Защита от раздвоения нот
-        if last_pitch and abs(freq - last_freq) < max_freq_diff:
-            # Приводим частоту к основной частоте, если разница мала
-            pitch_note = last_pitch
-
-        # Временные метки
-        current_time = times[i]
-
-        # Если интенсивность упала ниже порога и остаётся на этом уровне, нота считается затухающей
-        if last_intensity and intensities[i] < decay_threshold and last_intensity > decay_threshold:
-            # Затухающая нота, больше не обрабатываем
-            continue
-
-        # Если ноты одинаковые и идут очень быстро, увеличиваем длительность
-        if pitch_note == last_pitch:
-            if (current_time - last_onset_time) < 0.3:
-                last_duration += (current_time - last_onset_time)
-            else:
-                # Если интервал между одинаковыми нотами больше 0.3, добавляем ноту
-                notes_data.append({
-                    "pitch": last_pitch,
-                    "duration": round_to_note_duration(last_duration, tempo),
-                    "velocity": 85
-                })
-                last_duration = 0  # Сброс длительности
+# Векторное преобразование частот в MIDI-номера
+def hz_to_midi_array(hz):
+    return (np.round(12 * np.log2(np.asarray(hz) / 440)) + 69).astype(np.int64)
+
+# Преобразование MIDI-номера в название ноты (например, 69 -> "A4")
+def midi_to_note(midi_number):
+    return f'{NOTE_NAMES[midi_number % 12]}{midi_number // 12 - 1}'
+
+# Точная (последовательная, как в покадровом цикле) сумма шагов между кадрами сегмента
+def _sequential_duration(segment_times):
+    duration = 0
+    for i in range(1, len(segment_times)):
+        duration += segment_times[i] - segment_times[i - 1]
+    return duration
+
+class NoteSegmenter:
+    """
+    Сегментация нот целыми массивами с сохранением состояния между блоками кадров.
+
+    Повторяет правила покадрового алгоритма: отбор кадров по высоте и громкости,
+    пропуск затухающих кадров, сдвиг октавы, защита от раздвоения нот и
+    объединение одинаковых нот с промежутком меньше same_note_gap. Если известны
+    начала нот (onsets), одинаковая нота начинается заново только на найденном
+    начале, а правило same_note_gap не применяется. Кадры можно подавать
+    частями (feed), результат совпадает с обработкой всего контура сразу.
+    """
+    def __init__(self, tempo, intensity_threshold=0.4, max_freq_diff=1.0, decay_threshold=0.2, min_note_duration=0.1, min_pitch=50, same_note_gap=0.3, onsets=None):
+        """
+        :param tempo: Темп (ударов в минуту).
+        :param intensity_threshold: Минимальная интенсивность кадра.
+        :param max_freq_diff: Разница частот (Гц), при которой нота не меняется.
+        :param decay_threshold: Порог интенсивности затухающей ноты.
+        :param min_note_duration: Минимальная длительность ноты (в секундах).
+        :param min_pitch: Минимальная частота для ноты (в Гц).
+        :param same_note_gap: Промежуток (в секундах), после которого одинаковая нота считается новой.
+        :param onsets: Времена начал нот (в секундах, по возрастанию) или None.
+        """
+        self.tempo = tempo
+        self.intensity_threshold = intensity_threshold
+        self.max_freq_diff = max_freq_diff
+        self.decay_threshold = decay_threshold
+        self.min_note_duration = min_note_duration
+        self.min_pitch = min_pitch
+        self.same_note_gap = same_note_gap
+
+        # Пороги, около которых длительность пересчитывается последовательно
+        quarter_note_duration = 60 / tempo
+        note_durations = [quarter_note_duration * (1 / (2 ** i)) for i in range(8)]
+        self._thresholds = np.array([min_note_duration] + [(a + b) / 2 for a, b in zip(note_durations, note_durations[1:])])
+
+        # Состояние между блоками: последний принятый кадр и незавершённая нота
+        self._last_level = np.nan
+        self._last_freq = np.nan
+        self._last_pitch = -1
+        self._open_times = np.zeros(0)
+        self._open_start = None
+        self._open_pitch = -1
+        self._onsets = None if onsets is None else np.asarray(onsets, dtype=float)
+
+    def feed(self, times, frequencies, intensities, onsets=None):
+        """
+        Обработка очередного блока кадров.
+
+        :param times: Время каждого кадра высоты (в секундах).
+        :param frequencies: Частота каждого кадра (0 для кадров без высоты).
+        :param intensities: Интенсивность каждого кадра (после усиления контраста).
+        :param onsets: Начала нот, найденные в этом блоке (при потоковой обработке).
+        :return: Список завершённых нот в формате notesArray.
+        """
+        if onsets is not None:
+            previous = np.zeros(0) if self._onsets is None else self._onsets
+            self._onsets = np.concatenate([previous, np.asarray(onsets, dtype=float)])
+        frame_times, pitches = self._resolve_frames(times, frequencies, intensities)
+        return self._segment(frame_times, pitches, final=False)
+
+    def flush(self):
+        """
+        Завершение последней ноты в конце записи.
+
+        :return: Список нот в формате notesArray (пустой или из одной ноты).
+        """
+        return self._segment(np.zeros(0), np.zeros(0, dtype=np.int64), final=True)
+
+    def _resolve_frames(self, times, frequencies, intensities):
+        """
+        Отбор кадров и определение ноты каждого принятого кадра.
+        """
+        times = np.asarray(times, dtype=float)
+        frequencies = np.asarray(frequencies, dtype=float)
+        intensities = np.asarray(intensities, dtype=float)
+
+        # Кадры за пределами контура интенсивности считаем тишиной
+        n = len(frequencies)
+        if len(intensities) < n:
+            intensities = np.concatenate([intensities, np.full(n - len(intensities), -np.inf)])
+        intensities = intensities[:n]
+
+        # 1. Маска кадров: пропускаем шумы и тихие сигналы
+        voiced = np.flatnonzero(~((frequencies < self.min_pitch) | (intensities < self.intensity_threshold)))
+        levels = intensities[voiced]
+
+        # 2. Затухание: тихий кадр пропускается, если последний нетихий кадр перед ним
+        # был громче порога (пропущенные кадры не меняют состояние, поэтому решение
+        # одинаково для всей серии тихих кадров). NaN означает, что кадров ещё не было.
+        quiet = levels < self.decay_threshold
+        last_loud = np.maximum.accumulate(np.where(quiet, -1, np.arange(len(levels)))) if len(levels) else np.zeros(0, dtype=np.int64)
+        reference = np.where(last_loud >= 0, levels[np.maximum(last_loud, 0)] if len(levels) else levels, self._last_level)
+        decayed = quiet & (reference != 0) & (reference > self.decay_threshold)
+        frames = voiced[~decayed]
+
+        m = len(frames)
+        if m == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        self._last_level = intensities[frames[-1]]
+
+        # 3. Сдвиг октавы в диапазон гитары и перевод в MIDI-номера
+        folded = limit_note_range_array(frequencies[frames])
+        midi = hz_to_midi_array(folded)
+
+        # 4. Защита от раздвоения нот: при малой разнице частот остаётся предыдущая нота
+        # (индекс 0 — последний принятый кадр предыдущего блока)
+        midi = np.concatenate([[self._last_pitch], midi])
+        close = np.zeros(m + 1, dtype=bool)
+        close[1:] = np.abs(np.diff(np.concatenate([[self._last_freq], folded]))) < self.max_freq_diff
+        source = np.maximum.accumulate(np.where(close, 0, np.arange(m + 1)))
+        pitches = midi[source][1:]
+
+        self._last_freq = folded[-1]
+        self._last_pitch = pitches[-1]
+        return times[frames], pitches
+
+    def _segment(self, frame_times, pitches, final):
+        """
+        Разбиение принятых кадров на ноты (кодирование длин серий).
+        Последняя нота остаётся незавершённой до следующего блока или flush.
+        """
+        # Продолжаем незавершённую ноту предыдущего блока
+        frame_times = np.concatenate([self._open_times, frame_times])
+        pitches = np.concatenate([np.full(len(self._open_times), self._open_pitch, dtype=np.int64), pitches])
+        m = len(frame_times)
+        if m == 0:
+            return []
+
+        # 5. Границы нот: смена ноты или новое начало той же ноты —
+        # найденное между соседними кадрами или (без начал нот) долгий промежуток
+        changed = pitches[1:] != pitches[:-1]
+        if self._onsets is None:
+            gap = ~changed & (np.diff(frame_times) >= self.same_note_gap)
         else:
-            if last_pitch:
-                # Добавляем предыдущую ноту, если её длительность больше минимальной
-                if last_duration >= min_note_duration:
-                    notes_data.append({
-                        "pitch": last_pitch,
-                        "duration": round_to_note_duration(last_duration, tempo),
-                        "velocity": 85
-                    })
-            last_pitch = pitch_note
-            last_duration = 0
-
-        last_onset_time = current_time
-        last_freq = freq  # Сохраняем последнюю частоту для сравнения
-        last_intensity = intensities[i]  # Обновляем интенсивность
-
-    # Добавляем последнюю ноту, если её длительность больше минимальной
-    if last_pitch and last_duration >= min_note_duration:
-        notes_data.append({
-            "pitch": last_pitch,
-            "duration": round_to_note_duration(last_duration, tempo),
-            "velocity": 85
-        })
-
-    return notes_data
+            gap = ~changed & (np.diff(np.searchsorted(self._onsets, frame_times, side='right')) > 0)
+        starts = np.flatnonzero(np.concatenate([[True], changed | gap]))
+        ends = np.append(starts[1:] - 1, m - 1)
+        # Нота, прерванная промежутком, добавляется всегда; остальные (в том числе
+        # прерванные новым началом той же ноты) — только если достаточно длинные
+        ends_by_gap = np.append(gap[starts[1:] - 1], False) if self._onsets is None else np.zeros(len(starts), dtype=bool)
+
+        # Начало незавершённой ноты могло быть отброшено (см. _keep_open)
+        start_times = frame_times[starts]
+        if self._open_start is not None:
+            start_times[0] = self._open_start
+
+        if final:
+            self._open_times = np.zeros(0)
+            self._open_start = None
+        else:
+            # Последняя нота ещё может продолжиться в следующем блоке
+            self._keep_open(frame_times[starts[-1]:], start_times[-1], pitches[-1])
+            if self._onsets is not None:
+                # Начала нот до первого сохранённого кадра больше не понадобятся
+                self._onsets = self._onsets[self._onsets > self._open_times[0]]
+            starts, ends, ends_by_gap, start_times = starts[:-1], ends[:-1], ends_by_gap[:-1], start_times[:-1]
+
+        durations = frame_times[ends] - start_times
+
+        # Разность времён может отличаться от накопленной суммы в последнем бите;
+        # около порогов (минимальная длительность, середины между длительностями)
+        # пересчитываем длительность так же, как покадровый алгоритм
+        near = np.flatnonzero((np.abs(durations[:, None] - self._thresholds[None, :]) < 1e-9).any(axis=1))
+        for i in near:
+            durations[i] = _sequential_duration(frame_times[starts[i]:ends[i] + 1])
+
+        emitted = np.flatnonzero(ends_by_gap | (durations >= self.min_note_duration))
+        rounded = round_to_note_durations(durations[emitted], self.tempo)
+
+        return [
+            {
+                "pitch": midi_to_note(int(pitches[starts[i]])),
+                "duration": duration,
+                "velocity": 85
+            }
+            for i, duration in zip(emitted, rounded)
+        ]
+
+    def _keep_open(self, open_times, start_time, open_pitch):
+        """
+        Сохранение кадров незавершённой ноты.
+        Если нота уже длиннее всех порогов, точная сумма не понадобится,
+        и достаточно хранить время её начала и последний кадр (память не растёт).
+        """
+        if open_times[-1] - start_time > self._thresholds.max() + 1e-6:
+            self._open_times = open_times[-1:]
+            self._open_start = start_time
+        else:
+            self._open_times = open_times
+            self._open_start = None
+        self._open_pitch = open_pitch
+
+
+# Разбиение контуров высоты и интенсивности на ноты целыми массивами
+def segment_notes(times, frequencies, intensities, tempo, **params):
+    """
+    Сегментация нот без покадрового цикла Python.
+
+    :param times: Время каждого кадра высоты (в секундах).
+    :param frequencies: Частота каждого кадра (0 для кадров без высоты).
+    :param intensities: Интенсивность каждого кадра (после усиления контраста).
+    :param tempo: Темп (ударов в минуту).
+    :param params: Параметры NoteSegmenter.
+    :return: Список нот в формате notesArray.
+    """
+    segmenter = NoteSegmenter(tempo, **params)
+    return segmenter.feed(times, frequencies, intensities) + segmenter.flush()
+
+# Функция для извлечения нот из готовых контуров высоты и интенсивности
+def notes_from_contours(times, frequencies, intensities, tempo, intensity_threshold=0.4, contrast_factor=2, max_freq_diff=1.0, intensity_spike_threshold=0.1, decay_threshold=0.2, min_note_duration=0.1, onsets=None):
+    # Нормализация, усиление контраста и подавление скачков (скрежет и дрожание) в одной копии массива
+    intensities = condition_intensities(intensities, contrast_factor, intensity_spike_threshold)
+
+    # Сегментация нот целыми массивами
+    return segment_notes(times, frequencies, intensities, tempo, intensity_threshold=intensity_threshold,
+                         max_freq_diff=max_freq_diff, decay_threshold=decay_threshold,
+                         min_note_duration=min_note_duration, onsets=onsets)
+
+# Детекторы высоты звука: общий интерфейс и реализации
+class PitchBackend(ABC):
+    """
+    Интерфейс детектора высоты звука.
+
+    Детектор получает parselmouth.Sound и возвращает контур высоты: время кадров
+    и частоту каждого кадра (0 для кадров без высоты). Детектор без метода track
+    нельзя создать, поэтому ошибка видна при выборе детектора, а не посреди задания.
+    """
+    name = None
+
+    @abstractmethod
+    def track(self, snd):
+        """
+        :param snd: Звук parselmouth.Sound.
+        :return: Кортеж (время кадров в секундах, частоты в Гц).
+        """
+
+
+class PraatPitch(PitchBackend):
+    """
+    Детектор Praat (автокорреляция, настройки по умолчанию).
+    """
+    name = 'praat'
+
+    def track(self, snd):
+        pitch = snd.to_pitch()
+        return pitch.xs(), pitch.selected_array['frequency']
+
+
+class YinPitch(PitchBackend):
+    """
+    Детектор YIN на NumPy: разностная функция считается через FFT сразу для блока кадров,
+    задержки ищутся только в гитарном диапазоне (GUITAR_MIN_HZ–GUITAR_MAX_HZ).
+    Кадры расположены так же, как у Praat по умолчанию (шаг 0.01 с, окно 0.04 с),
+    поэтому контур совместим с остальной частью распознавания.
+    """
+    name = 'yin'
+
+    def __init__(self, min_hz=GUITAR_MIN_HZ, max_hz=GUITAR_MAX_HZ, time_step=0.01, window=0.04, threshold=0.15, silence_threshold=0.03, block_size=512):
+        """
+        :param min_hz: Нижняя граница поиска (Гц).
+        :param max_hz: Верхняя граница поиска (Гц).
+        :param time_step: Шаг кадров (в секундах).
+        :param window: Длина кадра (в секундах).
+        :param threshold: Порог нормированной разностной функции YIN.
+        :param silence_threshold: Кадры с пиком ниже этой доли общего пика считаются тишиной.
+        :param block_size: Сколько кадров обрабатывается одним FFT.
+        """
+        self.min_hz = min_hz
+        self.max_hz = max_hz
+        self.time_step = time_step
+        self.window = window
+        self.threshold = threshold
+        self.silence_threshold = silence_threshold
+        self.block_size = block_size
+
+    def frame_times(self, duration):
+        """
+        Время центров кадров (как в Praat: кадры по центру записи).
+        """
+        count = max(int(np.floor((duration - self.window) / self.time_step)) + 1, 0)
+        first = (duration - (count - 1) * self.time_step) / 2
+        return first + self.time_step * np.arange(count)
+
+    def track(self, snd):
+        signal = snd.values.mean(axis=0)
+        sample_rate = snd.sampling_frequency
+        times = self.frame_times(snd.xmax - snd.xmin)
+        return times + snd.xmin, self.track_signal(signal, sample_rate, times)
+
+    def track_signal(self, signal, sample_rate, times):
+        """
+        Частоты кадров с центрами в моменты times.
+
+        :param signal: Моно-сигнал.
+        :param sample_rate: Частота дискретизации (Гц).
+        :param times: Центры кадров (в секундах от начала сигнала).
+        :return: Частоты кадров (0 для кадров без высоты).
+        """
+        min_lag = max(int(np.floor(sample_rate / self.max_hz)), 2)
+        max_lag = int(np.ceil(sample_rate / self.min_hz))
+        length = max(int(round(self.window * sample_rate)), 2 * max_lag + 2)
+        span = length - max_lag  # Окно суммирования разностной функции
+        # j + τ < length при j < span и τ ≤ max_lag, поэтому циклическая корреляция длины ≥ length не заворачивается
+        size = 1 << int(np.ceil(np.log2(length)))
+
+        # Кадры как представления сигнала без копирования (края дополняются нулями)
+        padded = np.concatenate([np.zeros(length), np.asarray(signal, dtype=np.float64), np.zeros(length)])
+        frames = np.lib.stride_tricks.sliding_window_view(padded, length)
+        starts = np.round(times * sample_rate).astype(np.int64) - length // 2 + length
+        peak = np.abs(signal).max() if len(signal) else 0.0
+
+        frequencies = np.zeros(len(times))
+        lags = np.arange(max_lag + 1)
+        for block_start in range(0, len(times), self.block_size):
+            block = frames[starts[block_start:block_start + self.block_size]]
+
+            # Разностная функция d(τ) = Σ x[j]² + Σ x[j+τ]² − 2 Σ x[j]·x[j+τ], j < span
+            spectrum = np.fft.rfft(block, size, axis=1)
+            head = np.fft.rfft(block[:, :span], size, axis=1)
+            correlation = np.fft.irfft(spectrum * np.conj(head), size, axis=1)[:, :max_lag + 1]
+            squares = np.concatenate([np.zeros((len(block), 1)), np.cumsum(block ** 2, axis=1)], axis=1)
+            shifted_energy = squares[:, lags + span] - squares[:, lags]
+            difference = np.maximum(shifted_energy[:, :1] + shifted_energy - 2 * correlation, 0)
+
+            # Нормированная разностная функция: d'(τ) = d(τ) · τ / Σ d(1..τ)
+            cumulative = np.cumsum(difference[:, 1:], axis=1)
+            normalized = np.ones_like(difference)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                normalized[:, 1:] = np.where(cumulative > 0, difference[:, 1:] * lags[1:] / cumulative, 1.0)
+
+            # Первая задержка в диапазоне ниже порога, затем спуск до локального минимума
+            band = normalized[:, min_lag:max_lag]
+            below = band < self.threshold
+            voiced = below.any(axis=1)
+            first = below.argmax(axis=1)
+            rising = np.concatenate([band[:, 1:] >= band[:, :-1], np.ones((len(band), 1), dtype=bool)], axis=1)
+            lag = (rising & (np.arange(band.shape[1]) >= first[:, None])).argmax(axis=1) + min_lag
+
+            # Параболическая интерполяция минимума
+            rows = np.arange(len(block))
+            left = normalized[rows, lag - 1]
+            center = normalized[rows, lag]
+            right = normalized[rows, np.minimum(lag + 1, max_lag)]
+            curvature = left - 2 * center + right
+            with np.errstate(divide='ignore', invalid='ignore'):
+                shift = np.where(curvature > 0, 0.5 * (left - right) / curvature, 0.0)
+            refined = lag + np.clip(shift, -0.5, 0.5)
+
+            loud = np.abs(block).max(axis=1) >= self.silence_threshold * peak
+            result = np.where(voiced & loud & (peak > 0), sample_rate / refined, 0.0)
+            frequencies[block_start:block_start + len(block)] = result
+
+        return frequencies
+
+
+# Доступные детекторы высоты и детектор по умолчанию (можно выбрать переменной окружения)
+PITCH_BACKENDS = {backend.name: backend for backend in (PraatPitch, YinPitch)}
+DEFAULT_PITCH_BACKEND = os.environ.get('BARDDO_PITCH_BACKEND', 'praat')
+
+
+def get_pitch_backend(backend=None):
+    """
+    Детектор высоты по имени ('praat', 'yin') или уже созданный объект.
+
+    :param backend: Имя, объект PitchBackend или None (детектор по умолчанию).
+    :return: Объект PitchBackend.
+    """
+    if isinstance(backend, PitchBackend):
+        return backend
+    name = backend or DEFAULT_PITCH_BACKEND
+    if name not in PITCH_BACKENDS:
+        raise ValueError(f"Неизвестный детектор высоты: {name}")
+    return PITCH_BACKENDS[name]()
+
+
+# Функция для извлечения контуров высоты и интенсивности (самая долгая часть распознавания)
+# Версия контуров (входит в ключ кэша контуров): 2 — интенсивность в моменты кадров высоты
+CONTOURS_VERSION = 2
+
+def extract_contours(wav_file, pitch_backend=None, timer=None, envelope_time=None):
+    """
+    Анализ звука: контуры высоты и интенсивности.
+    Контуры не зависят от параметров сегментации, поэтому их можно сохранить
+    и пересчитывать ноты с другими порогами без повторного анализа.
+
+    :param wav_file: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :param pitch_backend: Детектор высоты (имя или объект PitchBackend; по умолчанию DEFAULT_PITCH_BACKEND).
+    :param timer: StageTimer для замера этапов pitch, intensity и onsets (необязательно).
+    :param envelope_time: Трапециевидная огибающая перед анализом (см. condition_sound; звук изменяется на месте).
+    :return: Словарь массивов: times, frequencies, intensities (в моменты кадров высоты),
+             onsets (начала нот) и onset_envelope (кривая новизны для оценки темпа).
+    """
+    # Загружаем аудиофайл с помощью parselmouth (или используем уже декодированный звук)
+    snd = as_sound(wav_file)
+
+    # Необязательная подготовка сигнала (на месте, без копий)
+    if envelope_time:
+        with timed(timer, "conditioning"):
+            condition_sound(snd, envelope_time)
 
-# Путь к файлам
-input_path = f"../input/{file_name}.wav"
-output_path = f"../data/{file_name}_input.json"
+    # Извлечение высоты звука (pitch) и интенсивности
+    with timed(timer, "pitch"):
+        times, frequencies = get_pitch_backend(pitch_backend).track(snd)
+    with timed(timer, "intensity"):
+        intensity = snd.to_intensity()
+    with timed(timer, "onsets"):
+        onsets = analyze_onsets(snd)
+
+    return {
+        "times": times,
+        "frequencies": frequencies,
+        "intensities": intensity_at(times, intensity),
+        **onsets
+    }
+
+def save_contours(path, contours):
+    """
+    Сохранение контуров в сжатый файл .npz.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Временный файл свой у каждого процесса: контуры одного задания могут сохраняться параллельно
+    temp_path = f"{path}.{os.getpid()}.part.npz"
+    np.savez_compressed(temp_path, **contours)
+    os.replace(temp_path, path)
+
+def load_contours(path):
+    """
+    Загрузка контуров из файла .npz.
+
+    :return: Словарь массивов: times, frequencies, intensities, onsets и onset_envelope (если сохранены).
+    """
+    with np.load(path) as data:
+        return {
+            name: data[name]
+            for name in ("times", "frequencies", "intensities", "onsets", "onset_envelope")
+            if name in data
+        }
+
+def detect_tempo(analysis):
+    """
+    Темп записи по уже посчитанной кривой новизны (анализ звука не повторяется).
+
+    :param analysis: Контуры (extract_contours) или кандидаты аккордов с массивом onset_envelope.
+    :return: Темп (ударов в минуту); DEFAULT_TEMPO, если кривой новизны нет.
+    """
+    if analysis.get("onset_envelope") is None:
+        return DEFAULT_TEMPO
+    return estimate_tempo(analysis["onset_envelope"])
 
-# Укажите темп (ударов в минуту)
-tempo = 120
+# Функция для извлечения нот и их длительностей
+def get_notes_and_durations(wav_file, tempo=None, intensity_threshold=0.4, contrast_factor=2, max_freq_diff=1.0, intensity_spike_threshold=0.1, decay_threshold=0.2, min_note_duration=0.1, pitch_backend=None, envelope_time=None):
+    # Извлечение высоты звука (pitch) и интенсивности; огибающая (если задана) применяется к сигналу до анализа
+    contours = extract_contours(wav_file, pitch_backend, envelope_time=envelope_time)
 
-# Получаем данные о нотах
-notes_data = get_notes_and_durations(input_path, tempo)
+    # Темп (если не задан) оценивается по кривой новизны
+    tempo = tempo or detect_tempo(contours)
 
-# Формируем JSON-структуру
-output_data = {
-    "notesArray": notes_data
-}
+    notes_data = notes_from_contours(contours["times"], contours["frequencies"], contours["intensities"], tempo,
+                                     intensity_threshold=intensity_threshold, contrast_factor=contrast_factor,
+                                     max_freq_diff=max_freq_diff, intensity_spike_threshold=intensity_spike_threshold,
+                                     decay_threshold=decay_threshold, min_note_duration=min_note_duration,
+                                     onsets=contours["onsets"])
 
-# Сохраняем в файл
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
-with open(output_path, 'w', encoding='utf-8') as json_file:
-    json.dump(output_data, json_file, indent=4, ensure_ascii=False)
+    return notes_data
 
-print(f"Мелодия успешно преобразована в {output_path}")
+# Чтение фрагмента WAV-файла в виде моно-сигнала float
+def read_wav_frames(wav, start_frame, frame_count):
+    """
+    Чтение фрагмента PCM WAV без загрузки всего файла.
+
+    :param wav: Открытый wave.Wave_read.
+    :param start_frame: Первый отсчёт фрагмента.
+    :param frame_count: Количество отсчётов.
+    :return: Моно-сигнал (среднее по каналам) в диапазоне [-1, 1].
+    """
+    sample_width = wav.getsampwidth()
+    dtypes = {1: np.uint8, 2: np.int16, 4: np.int32}
+    if sample_width not in dtypes:
+        raise ValueError(f"Неподдерживаемая разрядность WAV: {8 * sample_width} бит")
+
+    wav.setpos(start_frame)
+    samples = np.frombuffer(wav.readframes(frame_count), dtype=dtypes[sample_width]).astype(np.float64)
+    if sample_width == 1:
+        samples -= 128  # 8-битный PCM беззнаковый
+    samples /= 2 ** (8 * sample_width - 1)
+    return samples.reshape(-1, wav.getnchannels()).mean(axis=1)
+
+# Потоковое распознавание нот по перекрывающимся окнам
+def iter_notes(wav_file, tempo, window=30.0, overlap=0.1, intensity_threshold=0.4, contrast_factor=2, max_freq_diff=1.0, intensity_spike_threshold=0.1, decay_threshold=0.2, min_note_duration=0.1, pitch_backend=None):
+    """
+    Генератор нот для длинных записей: аудио читается окнами по window секунд,
+    поэтому память не зависит от длины файла, а ноты выдаются по мере готовности.
+
+    Каждое окно анализируется с запасом overlap секунд с обеих сторон, чтобы
+    кадры у границы окна считались по полному сигналу. Пик для нормализации
+    интенсивности — максимальный на текущий момент, поэтому результат может
+    немного отличаться от get_notes_and_durations.
+
+    :param wav_file: Путь к PCM WAV-файлу.
+    :param tempo: Темп (ударов в минуту).
+    :param window: Длина окна (в секундах).
+    :param overlap: Запас сигнала с каждой стороны окна (в секундах).
+    :param pitch_backend: Детектор высоты (имя или объект PitchBackend).
+    :return: Генератор нот в формате notesArray.
+    """
+    backend = get_pitch_backend(pitch_backend)
+    segmenter = NoteSegmenter(tempo, intensity_threshold=intensity_threshold, max_freq_diff=max_freq_diff,
+                              decay_threshold=decay_threshold, min_note_duration=min_note_duration, onsets=[])
+    peak = 0.0
+    previous_intensity = None
+
+    with wave.open(wav_file, 'rb') as wav:
+        sample_rate = wav.getframerate()
+        total_frames = wav.getnframes()
+        window_frames = max(1, int(window * sample_rate))
+        margin_frames = int(overlap * sample_rate)
+
+        for core_start in range(0, total_frames, window_frames):
+            core_end = min(core_start + window_frames, total_frames)
+            start = max(0, core_start - margin_frames)
+            end = min(total_frames, core_end + margin_frames)
+
+            snd = make_sound(read_wav_frames(wav, start, end - start), sample_rate, start / sample_rate)
+            times, frequencies = backend.track(snd)
+            intensity = snd.to_intensity()
+            onsets = detect_onsets(snd)
+
+            # Оставляем только кадры высоты и начала нот внутри окна (без запаса)
+            inside = (times >= core_start / sample_rate) & (times < core_end / sample_rate)
+            times = times[inside]
+            frequencies = frequencies[inside]
+            onsets = onsets[(onsets >= core_start / sample_rate) & (onsets < core_end / sample_rate)]
+            if not len(times):
+                continue
+
+            # Интенсивность в моменты кадров высоты
+            intensities = intensity_at(times, intensity)
+
+            # Нормализация по пику, найденному к текущему моменту, и усиление контраста
+            peak = max(peak, float(np.max(intensities)))
+            enhance_contrast(intensities, contrast_factor, peak)
+
+            # Фильтрация скачков с учётом последнего кадра предыдущего окна
+            last_intensity = intensities[-1]
+            filter_intensity_spikes(intensities, intensity_spike_threshold, previous_intensity)
+            previous_intensity = last_intensity
+
+            yield from segmenter.feed(times, frequencies, intensities, onsets)
+
+    yield from segmenter.flush()
+
+
+def recognize(input_path, output_path, tempo=None, pitch_backend=None, envelope_time=None, **params):
+    """
+    Распознавание нот в WAV-файле и сохранение результата.
+
+    :param input_path: Путь к WAV-файлу или декодированный parselmouth.Sound.
+    :param output_path: Путь для сохранения нот (.json — JSON, иначе двоичный формат).
+    :param tempo: Темп (ударов в минуту); None — оценить по записи.
+    :param pitch_backend: Детектор высоты (имя или объект PitchBackend).
+    :param envelope_time: Трапециевидная огибающая перед анализом (в секундах; None — без неё).
+    :param params: Параметры notes_from_contours (пороги, контраст и т. д.).
+    :return: JSON-структура с массивом нот и темпом.
+    """
+    # Анализ звука и сегментация по контурам (темп оценивается по тем же контурам)
+    contours = extract_contours(input_path, pitch_backend, envelope_time=envelope_time)
+    return recognize_contours(contours, output_path, tempo, **params)
+
+
+def recognize_contours(contours, output_path, tempo=None, **params):
+    """
+    Распознавание нот по сохранённым контурам (только сегментация, без анализа звука)
+    и сохранение результата.
+
+    :param contours: Словарь массивов times, frequencies, intensities (см. extract_contours).
+    :param output_path: Путь для сохранения нот (.json — JSON, иначе двоичный формат).
+    :param tempo: Темп (ударов в минуту); None — оценить по кривой новизны контуров.
+    :param params: Параметры notes_from_contours (пороги, контраст и т. д.).
+    :return: JSON-структура с массивом нот и темпом.
+    """
+    tempo = tempo or detect_tempo(contours)
+    notes_data = notes_from_contours(contours["times"], contours["frequencies"], contours["intensities"], tempo,
+                                     onsets=contours.get("onsets"), **params)
+    return write_notes(notes_data, output_path, tempo)
+
+
+def write_notes(notes_data, output_path, tempo=None):
+    """
+    Сохранение массива нот: в JSON, если путь оканчивается на .json,
+    иначе в компактном двоичном формате (см. Notes.save).
+
+    :param tempo: Темп, по которому квантованы длительности (сохраняется вместе с нотами).
+    :return: JSON-структура с массивом нот.
+    """
+    # Формируем JSON-структуру
+    output_data = {
+        "notesArray": notes_data
+    }
+    if tempo:
+        output_data["tempo"] = tempo
+
+    # Сохраняем в файл
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if output_path.endswith('.json'):
+        with open(output_path, 'w', encoding='utf-8') as json_file:
+            json.dump(output_data, json_file, indent=4, ensure_ascii=False)
+    else:
+        Notes.from_json(output_data).save(output_path)
+
+    print(f"Мелодия успешно преобразована в {output_path}")
+    return output_data
+
+
+if __name__ == "__main__":
+    file_name = file_name_from_argv()
+
+    # Путь к файлам
+    input_path = f"../input/{file_name}.wav"
+    output_path = f"../data/{file_name}_notes.bin"
+
+    # Темп (ударов в минуту); None — определить по записи
+    tempo = None
+
+    recognize(input_path, output_path, tempo)
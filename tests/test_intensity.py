@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from decode_audio import make_sound
+from recognition import condition_intensities, extract_contours, filter_intensity_spikes, notes_from_contours, segment_notes
+
+
+def baseline_filter_intensity_spikes(intensities, threshold=0.1):
+    """
+    Прежний покадровый фильтр скачков: результат на один кадр короче входа.
+    """
+    filtered = []
+    for i in range(1, len(intensities)):
+        if abs(intensities[i] - intensities[i-1]) < threshold:
+            filtered.append(intensities[i])
+        else:
+            filtered.append(intensities[i-1])
+    return np.array(filtered)
+
+
+def test_filter_intensity_spikes_matches_baseline_loop():
+    rng = np.random.default_rng(0)
+    for threshold in (0.05, 0.1, 0.3):
+        intensities = rng.random(20000)
+        expected = baseline_filter_intensity_spikes(intensities, threshold)
+
+        filtered = filter_intensity_spikes(intensities.copy(), threshold)
+
+        # Те же значения, сдвинутые на кадр: первый кадр не меняется, длина сохраняется
+        assert len(filtered) == len(intensities)
+        assert filtered[0] == intensities[0]
+        np.testing.assert_array_equal(filtered[1:], expected)
+
+
+def test_condition_intensities_range_and_length():
+    sample_rate = 16000
+    t = np.arange(2 * sample_rate) / sample_rate
+    # Нота с нарастанием громкости и пауза: интенсивность в дБ, в том числе отрицательная
+    signal = np.where(t < 1.5, np.sin(2 * np.pi * 220 * t) * t, 0.0) + 1e-4 * np.random.default_rng(1).standard_normal(len(t))
+    contours = extract_contours(make_sound(signal, sample_rate))
+
+    intensities = condition_intensities(contours["intensities"])
+
+    assert len(intensities) == len(contours["frequencies"])
+    assert np.all((intensities >= 0) & (intensities <= 1))
+    assert np.isclose(intensities.max(), 1.0)
+
+
+
+def test_default_contrast_keeps_baseline_notes():
+    # Мелодия из восьми затухающих нот с паузами и разной громкостью (-18..0 дБ)
+    sample_rate = 16000
+    rng = np.random.default_rng(2)
+    parts = []
+    for frequency in (196, 220, 247, 262, 294, 330, 349, 392):
+        t = np.arange(int(0.4 * sample_rate)) / sample_rate
+        gain = 10 ** (rng.uniform(-18, 0) / 20)
+        parts += [gain * np.sin(2 * np.pi * frequency * t) * np.exp(-3 * t), np.zeros(int(0.1 * sample_rate))]
+    signal = np.concatenate(parts)
+    signal += 1e-4 * rng.standard_normal(len(signal))
+    contours = extract_contours(make_sound(signal, sample_rate))
+
+    # Прежняя подготовка: степень 10 без нормализации, затем выравнивание пиков и покадровый фильтр
+    # (первый кадр добавлен обратно, чтобы кадры совпадали с кадрами высоты)
+    baseline = np.clip(contours["intensities"] ** 10, 0, 1)
+    baseline = baseline / baseline.max()
+    baseline = baseline_filter_intensity_spikes(baseline, 0.1)
+    baseline = np.concatenate([baseline[:1], baseline])
+    expected = segment_notes(contours["times"], contours["frequencies"], baseline, 120, intensity_threshold=0.4,
+                             max_freq_diff=1.0, decay_threshold=0.2, min_note_duration=0.1, onsets=contours["onsets"])
+
+    notes = notes_from_contours(contours["times"], contours["frequencies"], contours["intensities"], 120, onsets=contours["onsets"])
+
+    assert len(notes) == 8
+    assert notes == expected
+
+
+if __name__ == "__main__":
+    test_filter_intensity_spikes_matches_baseline_loop()
+    test_condition_intensities_range_and_length()
+    test_default_contrast_keeps_baseline_notes()
+    print("OK")
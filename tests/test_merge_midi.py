@@ -0,0 +1,102 @@
+import os
+import sys
+import struct
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from classes.notes import Notes
+from notes_to_midi import merge_to_midi
+
+
+def read_variable_length(data, position):
+    """
+    Чтение числа переменной длины MIDI: (значение, позиция после него).
+    """
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, position
+
+
+def note_events(path):
+    """
+    События нот каждого трека MIDI-файла формата 1 с единственным темпом в треке 0:
+    список кортежей (время в секундах, note_on или нет, нота).
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    _, _, track_count, ticks_per_beat = struct.unpack(">IHHH", data[4:14])
+    position = 14
+    tempo = 500000
+    tracks = []
+    for _ in range(track_count):
+        length = struct.unpack(">I", data[position + 4:position + 8])[0]
+        position += 8
+        end = position + length
+        ticks, events = 0, []
+        while position < end:
+            delta, position = read_variable_length(data, position)
+            ticks += delta
+            status = data[position]
+            if status == 0xFF:
+                kind = data[position + 1]
+                size, position = read_variable_length(data, position + 2)
+                if kind == 0x51:
+                    tempo = int.from_bytes(data[position:position + 3], 'big')
+                position += size
+            else:
+                is_on = status & 0xF0 == 0x90 and data[position + 2] > 0
+                events.append((ticks * tempo / ticks_per_beat / 1e6, is_on, data[position + 1]))
+                position += 3
+        tracks.append(events)
+    return tracks
+
+
+def note_on_seconds(path):
+    """
+    Время (в секундах) событий note_on каждого трека.
+    """
+    return [[time for time, is_on, _ in events if is_on] for events in note_events(path)]
+
+
+def test_merge_keeps_real_timing_for_different_tempos():
+    # Одинаковая мелодия в секундах: ноты каждые 0.5 с, записанные в темпах 120 и 90
+    seconds = [0.0, 0.5, 1.0, 1.5]
+    fast = Notes.from_arrays([60] * 4, [1.0] * 4, [100] * 4, [s * 120 / 60 for s in seconds], tempo=120)
+    slow = Notes.from_arrays([64] * 4, [0.75] * 4, [100] * 4, [s * 90 / 60 for s in seconds], tempo=90)
+
+    path = os.path.join(tempfile.mkdtemp(), 'merged.mid')
+    merge_to_midi([fast, slow], path, names=["fast", "slow"])
+
+    _, fast_times, slow_times = note_on_seconds(path)
+    for expected, fast_time, slow_time in zip(seconds, fast_times, slow_times):
+        assert abs(fast_time - expected) < 0.01
+        assert abs(slow_time - expected) < 0.01
+
+
+def test_short_notes_start_before_they_end():
+    # Нота 1/128 при пересчёте темпа 240 → 60 короче тика: note_off не должен обгонять note_on
+    short = Notes.from_arrays([60, 62, 64], [1 / 128] * 3, [80] * 3, [0.0, 1 / 128, 1.0], tempo=240)
+
+    path = os.path.join(tempfile.mkdtemp(), 'merged.mid')
+    merge_to_midi([short], path, tempo=60, names=["short"])
+
+    for events in note_events(path):
+        sounding = set()
+        for _, is_on, pitch in events:
+            if is_on:
+                sounding.add(pitch)
+            else:
+                assert pitch in sounding
+                sounding.remove(pitch)
+        assert not sounding
+
+
+if __name__ == "__main__":
+    test_merge_keeps_real_timing_for_different_tempos()
+    test_short_notes_start_before_they_end()
+    print("OK")